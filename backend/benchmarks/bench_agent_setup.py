@@ -0,0 +1,52 @@
+"""Per-request setup cost of the Mistral agent, before and after sharing it.
+
+Usage (from backend/):
+    python -m benchmarks.bench_agent_setup --iterations 200
+
+"per-request build" is what /mistral_response used to pay on every call:
+constructing the tools, prompt, ChatMistralAI client, AgentExecutor and
+RunnableWithMessageHistory. "shared agent" is what it pays now: entering
+use_chat_context around a prebuilt agent. No network calls are made.
+"""
+import argparse
+import os
+import time
+
+import motor.motor_asyncio
+import pymongo
+
+from location_index import LocationNameIndex
+from mistral_utils import initalize_chat_model, initalize_sort_model, use_chat_context
+
+def time_per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+def main(args):
+    api_key = os.environ.get("MISTRAL_API_KEY", "benchmark-key")
+    locations_db = motor.motor_asyncio.AsyncIOMotorClient("mongodb://localhost:27017/")["whatnextDatabase"]["locationsv2"]
+    name_index = LocationNameIndex(pymongo.MongoClient("mongodb://localhost:27017/")["whatnextDatabase"]["locationsv2"])
+    sort_model = initalize_sort_model(model_name="mistral-small-latest", api_key=api_key)
+
+    def build():
+        initalize_chat_model(model_name="mistral-large-latest", api_key=api_key,
+                             locations_db=locations_db, name_index=name_index, sort_model=sort_model)
+
+    def enter_context():
+        with use_chat_context(latitude=32.87, longitude=-117.21, session_id="benchmark"):
+            pass
+
+    build()
+    per_request_build = time_per_call(build, args.iterations)
+    shared_agent = time_per_call(enter_context, args.iterations)
+
+    print(f"per-request build: {per_request_build * 1e3:9.3f} ms")
+    print(f"shared agent:      {shared_agent * 1e3:9.3f} ms")
+    print(f"speedup:           {per_request_build / shared_agent:9.0f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+"""Categories regex vs indexed category_keys array on a synthetic collection.
+
+Usage (from backend/, against a local throwaway mongod):
+    python -m benchmarks.bench_category_query --mongo-url mongodb://localhost:27017/ --documents 1000000
+
+Seeds ``--documents`` synthetic locations around San Diego into
+whatnextBenchmark.locations (skipped if already seeded), builds the indexes
+from migrations.py, then times the nearby query in both category modes and
+reports median latency and documents examined.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import pymongo
+
+from location_queries import build_nearby_query
+from migrations import create_category_indexes
+from utils import normalize_categories
+
+CATEGORIES = ["Coffee & Tea", "Cafes", "Restaurants", "Japanese", "Ramen", "Bars", "Hiking", "Parks",
+              "Shopping", "Fitness", "Beauty & Spas", "Aquariums", "Bakeries", "Pizza", "Mexican"]
+TAGS = ["coffee", "japanese", "burgers", "brewpubs", "hiking", "tabletopgames", "spanish", "costumes"]
+CENTER = (32.8723812680163, -117.21242234341588)
+
+def synthetic_location(rng, index):
+    categories = rng.sample(CATEGORIES, rng.randint(1, 3))
+    return {
+        "business_id": f"bench-{index}",
+        "name": f"Location {index}",
+        "location": {"type": "Point",
+                     "coordinates": [CENTER[1] + rng.uniform(-0.5, 0.5), CENTER[0] + rng.uniform(-0.5, 0.5)]},
+        "categories": [", ".join(categories)],
+        "category_keys": normalize_categories(categories),
+        "tag": rng.sample(TAGS, rng.randint(0, 2)),
+        "stars": rng.choice([3.0, 3.5, 4.0, 4.5, 5.0]),
+        "review_count": rng.randint(0, 3000),
+        "cur_open": 1,
+    }
+
+def seed(collection, documents, batch_size=10000):
+    if collection.estimated_document_count() >= documents:
+        return
+    collection.drop()
+    rng = random.Random(0)
+    for start in range(0, documents, batch_size):
+        batch = [synthetic_location(rng, index) for index in range(start, min(start + batch_size, documents))]
+        collection.insert_many(batch, ordered=False)
+    create_category_indexes(collection)
+    collection.create_index([("location", pymongo.GEOSPHERE)], name="location")
+
+def run(collection, mode, queries, limit):
+    latencies, examined = [], []
+    for latitude, longitude, categories in queries:
+        query = build_nearby_query(latitude, longitude, 10000, categories, None, category_mode=mode)
+        start = time.perf_counter()
+        list(collection.find(query, {"_id": 0}).sort("review_count", -1).limit(limit))
+        latencies.append(time.perf_counter() - start)
+        stats = collection.find(query).sort("review_count", -1).limit(limit).explain()["executionStats"]
+        examined.append(stats["totalDocsExamined"])
+    return statistics.median(latencies), statistics.median(examined)
+
+def main(args):
+    collection = pymongo.MongoClient(args.mongo_url)["whatnextBenchmark"]["locations"]
+    seed(collection, args.documents)
+
+    rng = random.Random(1)
+    queries = [(CENTER[0] + rng.uniform(-0.3, 0.3), CENTER[1] + rng.uniform(-0.3, 0.3), [rng.choice(CATEGORIES)])
+               for _ in range(args.queries)]
+
+    print(f"{'mode':>6} {'median ms':>10} {'docs examined':>14}")
+    for mode in ("regex", "array"):
+        latency, examined = run(collection, mode, queries, args.limit)
+        print(f"{mode:>6} {latency * 1e3:>10.2f} {examined:>14.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017/")
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    main(parser.parse_args())
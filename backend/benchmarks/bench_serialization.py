@@ -0,0 +1,79 @@
+"""CPU cost of serializing a page of locations, validated vs fast path.
+
+Usage (from backend/):
+    python -m benchmarks.bench_serialization --items 20 50 --iterations 500
+
+"validated" reproduces the old /nearby_locations work: Location(**item) for
+every document, then FastAPI's response_model pass (dump, re-validate against
+List[Location], serialize) and json.dumps. "fast" is the current path:
+projected documents shaped with to_document and encoded by orjson.
+"""
+import argparse
+import json
+import random
+import time
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from models import Location, to_document
+from utils import hours_to_open_intervals
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def realistic_location(rng, index):
+    hours = {day: ["0800", rng.choice(["1700", "2100", "0200"])] for day in DAYS if rng.random() > 0.1}
+    latitude, longitude = 32.87 + rng.uniform(-0.1, 0.1), -117.21 + rng.uniform(-0.1, 0.1)
+    return {
+        "business_id": f"food{index:04d}",
+        "name": f"Neighbourhood Cafe {index}",
+        "image_url": f"https://s3-media1.fl.yelpcdn.com/bphoto/{index:022d}/o.jpg",
+        "phone": "+16195550100",
+        "display_phone": "(619) 555-0100",
+        "address": f"{index} Genesee Ave",
+        "city": "San Diego",
+        "state": "CA",
+        "postal_code": "92122",
+        "latitude": latitude,
+        "longitude": longitude,
+        "stars": rng.choice([3.5, 4.0, 4.5]),
+        "review_count": rng.randint(10, 3000),
+        "cur_open": 1,
+        "categories": ["food", "coffee"],
+        "tag": ["coffee", "cafes", "breakfast_brunch"],
+        "hours": hours,
+        "open_intervals": hours_to_open_intervals(hours),
+        "location": {"type": "Point", "coordinates": [longitude, latitude]},
+        "price": "$$",
+    }
+
+def validated(items, adapter):
+    locations = [Location(**item) for item in items]
+    content = [location.model_dump() for location in locations]
+    return json.dumps(adapter.dump_python(adapter.validate_python(content), mode="json")).encode("utf-8")
+
+def fast(items, adapter):
+    return orjson.dumps([to_document(Location, item) for item in items])
+
+def time_per_call(func, items, adapter, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(items, adapter)
+    return (time.perf_counter() - start) / iterations
+
+def main(args):
+    rng = random.Random(0)
+    adapter = TypeAdapter(List[Location])
+    print(f"{'items':>5} {'validated ms':>13} {'fast ms':>8} {'speedup':>8}")
+    for count in args.items:
+        items = [realistic_location(rng, index) for index in range(count)]
+        before = time_per_call(validated, items, adapter, args.iterations)
+        after = time_per_call(fast, items, adapter, args.iterations)
+        print(f"{count:>5} {before * 1e3:>13.3f} {after * 1e3:>8.3f} {before / after:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[20, 50])
+    parser.add_argument("--iterations", type=int, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,131 @@
+"""Seeded synthetic dataset for the offline benchmarks.
+
+Usage (from backend/, against a local throwaway mongod):
+    python -m benchmarks.dataset --mongo-url mongodb://localhost:27017/ --locations 5000 --users 200
+
+Fills ``locations`` (nearby and chat paths), ``locationsv2`` (Mistral agent)
+and ``users`` (profile endpoints) of a benchmark database with documents
+shaped like production ones, tags and categories drawn from the assistant
+vocabulary, and builds the same indexes as migrations.py. The same seed and
+sizes always produce the same documents, so runs are comparable; an already
+seeded database is left alone.
+"""
+import argparse
+import random
+
+import pymongo
+
+from migrations import create_category_indexes, create_open_interval_indexes
+from utils import hours_to_open_intervals, normalize_categories
+from vocabulary import vocabulary_registry
+
+DATABASE_NAME = "whatnextBenchmark"
+CENTER = (32.8723812680163, -117.21242234341588)
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+# Tags the recorded chat turns ask for, so every chat finds candidates
+COMMON_TAGS = ["coffee", "japanese", "burgers", "brewpubs", "hiking", "tabletopgames"]
+
+def user_id(index):
+    return f"replay-user-{index:05d}"
+
+def business_id(index):
+    return f"replay-{index:06d}"
+
+def synthetic_hours(rng):
+    opening = rng.choice(["0000", "0600", "0800", "1100"])
+    closing = rng.choice(["1400", "1700", "2100", "2359"])
+    return {day: [opening, closing] for day in DAYS if rng.random() > 0.1}
+
+def location_document(rng, index, tags, categories):
+    latitude, longitude = CENTER[0] + rng.uniform(-0.2, 0.2), CENTER[1] + rng.uniform(-0.2, 0.2)
+    location_categories = rng.sample(categories, rng.randint(1, 2))
+    location_tags = rng.sample(tags, rng.randint(1, 3))
+    if rng.random() < 0.5:
+        location_tags.append(rng.choice(COMMON_TAGS))
+    location_tags = list(dict.fromkeys(location_tags))
+    hours = synthetic_hours(rng)
+    return {
+        "business_id": business_id(index),
+        "name": f"Replay {location_tags[0].title()} {index}",
+        "image_url": f"https://example.com/replay/{index}.jpg",
+        "phone": "+16195550100",
+        "display_phone": "(619) 555-0100",
+        "address": f"{index} Genesee Ave",
+        "city": "San Diego",
+        "state": "CA",
+        "postal_code": "92122",
+        "latitude": latitude,
+        "longitude": longitude,
+        "location": {"type": "Point", "coordinates": [longitude, latitude]},
+        "stars": rng.choice([2.5, 3.0, 3.5, 4.0, 4.5, 5.0]),
+        "review_count": rng.randint(0, 3000),
+        "cur_open": 1,
+        "categories": [", ".join(location_categories)],
+        "category_keys": normalize_categories(location_categories),
+        "tag": location_tags,
+        "hours": hours,
+        "open_intervals": hours_to_open_intervals(hours),
+        "price": rng.choice(["$", "$$", "$$$"]),
+    }
+
+def location_v2_document(location):
+    # locationsv2 keeps tags under "tags" and carries the summary the agent reads
+    document = {key: value for key, value in location.items() if key not in ("_id", "tag", "category_keys")}
+    document["tags"] = location["tag"]
+    document["price"] = len(location["price"])
+    document["summary"] = f"A {', '.join(location['tag'])} spot rated {location['stars']} by {location['review_count']} reviewers."
+    document["stars"] = int(location["stars"])
+    return document
+
+def user_document(rng, index, users, locations, tags):
+    return {
+        "user_id": user_id(index),
+        "display_name": f"Replay User {index}",
+        "image_url": None,
+        "friends": [user_id(friend) for friend in rng.sample(range(users), min(users, 8)) if friend != index],
+        "visited": [business_id(location) for location in rng.sample(range(locations), min(locations, 12))],
+        "favorites": [business_id(location) for location in rng.sample(range(locations), min(locations, 6))],
+        "food_and_drinks_tag": rng.sample(COMMON_TAGS[:4], 2),
+        "activities_tag": rng.sample(tags, 2),
+    }
+
+def create_indexes(db):
+    for name in ("locations", "locationsv2"):
+        db[name].create_index([("location", pymongo.GEOSPHERE)], name="location")
+        create_open_interval_indexes(db[name])
+    create_category_indexes(db["locations"])
+    db["locations"].create_index("business_id", name="business_id")
+    db["locationsv2"].create_index("name", name="name")
+    db["users"].create_index("user_id", name="user_id")
+
+def seed_database(db, locations=5000, users=200, seed=0, batch_size=5000):
+    """Seed ``db`` unless it already holds this exact dataset."""
+    marker = {"_id": "dataset", "locations": locations, "users": users, "seed": seed}
+    if db["benchmark_meta"].find_one(marker) is not None:
+        return False
+
+    for name in ("locations", "locationsv2", "users", "benchmark_meta"):
+        db[name].drop()
+    rng = random.Random(seed)
+    tags = list(vocabulary_registry.tags_list)
+    categories = [category for category in vocabulary_registry.categories_list if category != "all"]
+    for start in range(0, locations, batch_size):
+        batch = [location_document(rng, index, tags, categories)
+                 for index in range(start, min(start + batch_size, locations))]
+        db["locations"].insert_many(batch, ordered=False)
+        db["locationsv2"].insert_many([location_v2_document(location) for location in batch], ordered=False)
+    db["users"].insert_many([user_document(rng, index, users, locations, tags) for index in range(users)], ordered=False)
+    create_indexes(db)
+    db["benchmark_meta"].insert_one(marker)
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017/")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    seeded = seed_database(pymongo.MongoClient(args.mongo_url)[args.database], args.locations, args.users, args.seed)
+    print(f"{args.database}: {'seeded' if seeded else 'already seeded'}")
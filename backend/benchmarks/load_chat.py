@@ -0,0 +1,66 @@
+"""Concurrent load test for the chat endpoints of a running server.
+
+Usage (from backend/):
+    python -m benchmarks.load_chat --url http://localhost:8080 --endpoint /mistral_response --concurrency 1 4 16
+
+Each concurrency level sends ``--requests`` chats split across that many
+workers and reports throughput, so overlapping chats show up as requests per
+second growing with concurrency.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_MESSAGES = [
+    "I would like to drink some coffee",
+    "Any good ramen nearby?",
+    "Where can I go hiking this afternoon?",
+    "Suggest a place for brunch",
+]
+
+async def run_level(client, endpoint, concurrency, total_requests, user_id, latitude, longitude):
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(total_requests):
+        queue.put_nowait(DEFAULT_MESSAGES[i % len(DEFAULT_MESSAGES)])
+
+    async def worker():
+        while True:
+            try:
+                message = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {"user_id": user_id, "message": message, "latitude": latitude, "longitude": longitude}
+            start = time.perf_counter()
+            response = await client.post(endpoint, json=payload)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return elapsed, latencies
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        print(f"{'concurrency':>11} {'requests':>8} {'seconds':>8} {'req/s':>7} {'p50 s':>7} {'max s':>7}")
+        for concurrency in args.concurrency:
+            elapsed, latencies = await run_level(client, args.endpoint, concurrency, args.requests,
+                                                 args.user_id, args.latitude, args.longitude)
+            print(f"{concurrency:>11} {len(latencies):>8} {elapsed:>8.2f} {len(latencies) / elapsed:>7.2f} "
+                  f"{statistics.median(latencies):>7.2f} {max(latencies):>7.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--endpoint", default="/mistral_response")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--user-id", default="wiVOrMOJ8COqs7d6OgCBNVTV9lt2")
+    parser.add_argument("--latitude", type=float, default=32.8723812680163)
+    parser.add_argument("--longitude", type=float, default=-117.21242234341588)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,149 @@
+"""Offline replay benchmark for the nearby, chat and profile endpoints.
+
+Usage (from backend/, against a local throwaway mongod):
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.replay --mongo-url mongodb://localhost:27017/ --concurrency 16 --requests 200
+
+Runs the app in process against the seeded synthetic dataset of dataset.py,
+fakeredis (or ``--redis-url``) and a local stub of the OpenAI and Mistral
+APIs that replays recorded turns (replay_stub.py), so no API key or network
+access is needed and runs are repeatable. Each scenario sends ``--requests``
+requests from ``--concurrency`` workers and reports p50/p95/p99 latency and
+throughput per endpoint. ``--latency-scale 0`` drops the recorded model
+latency to measure the backend alone.
+
+MongoDB has to be a real mongod: mongomock does not run $nearSphere or $geoNear.
+"""
+import argparse
+import asyncio
+import importlib
+import math
+import os
+import random
+import time
+from collections import defaultdict
+
+import httpx
+import pymongo
+
+from benchmarks.dataset import CENTER, DATABASE_NAME, seed_database, user_id
+from benchmarks.replay_stub import RECORDINGS_PATH, Replay, StubServer, create_stub_app, load_recordings
+
+SCENARIOS = ["nearby", "chatgpt", "mistral", "profile"]
+PROFILE_ENDPOINTS = ["/user_info", "/friends_info", "/visited_info", "/favorites_info", "/profile_bundle", "/tags_info"]
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def scenario_requests(scenario, count, rng, args, turns):
+    """``count`` requests of ``scenario`` as (endpoint, method, path, request kwargs)."""
+    for index in range(count):
+        # Users spread around the dataset centre, a few kilometres apart
+        latitude = CENTER[0] + rng.uniform(-0.05, 0.05)
+        longitude = CENTER[1] + rng.uniform(-0.05, 0.05)
+        if scenario == "nearby":
+            params = {"latitude": latitude, "longitude": longitude, "limit": 20, "radius": 10000,
+                      "cur_open": rng.choice([0, 1]), "sort_by": rng.choice(["review_count", "stars"])}
+            yield "/nearby_locations", "GET", "/nearby_locations", {"params": params}
+        elif scenario in ("chatgpt", "mistral"):
+            path = "/chatgpt_response" if scenario == "chatgpt" else "/mistral_response"
+            body = {"user_id": user_id(rng.randrange(args.users)), "message": rng.choice(turns)["message"],
+                    "latitude": latitude, "longitude": longitude, "ranker": args.ranker}
+            yield path, "POST", path, {"json": body}
+        else:
+            path = PROFILE_ENDPOINTS[index % len(PROFILE_ENDPOINTS)]
+            yield path, "POST", path, {"json": {"user_id": user_id(rng.randrange(args.users))}}
+
+async def run_scenario(client, requests, concurrency):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def worker():
+        while True:
+            try:
+                endpoint, method, path, kwargs = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[endpoint].append(time.perf_counter() - start)
+            if failed:
+                errors[endpoint] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+async def run(args, app_module, turns):
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=args.timeout) as client:
+        print(f"{'endpoint':<20} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for scenario in args.scenarios:
+            # Warm-up requests provision the assistant, build the agent and fill connection pools
+            await run_scenario(client, list(scenario_requests(scenario, args.warmup, rng, args, turns)), args.concurrency)
+            elapsed, latencies, errors = await run_scenario(
+                client, list(scenario_requests(scenario, args.requests, rng, args, turns)), args.concurrency)
+            for endpoint, values in latencies.items():
+                values.sort()
+                print(f"{endpoint:<20} {len(values):>8} {errors[endpoint]:>6} {len(values) / elapsed:>8.1f} "
+                      f"{percentile(values, 50) * 1e3:>8.1f} {percentile(values, 95) * 1e3:>8.1f} "
+                      f"{percentile(values, 99) * 1e3:>8.1f}")
+    await app_module.clients.aclose()
+
+def main(args):
+    seed_database(pymongo.MongoClient(args.mongo_url)[args.database], args.locations, args.users, args.seed)
+    recordings = load_recordings(args.recordings)
+    stub = StubServer(create_stub_app(Replay(recordings, latency_scale=args.latency_scale))).start()
+
+    # The app reads its settings at import time
+    os.environ.update({
+        "MONGO_URL": args.mongo_url,
+        "MONGO_DATABASE": args.database,
+        "OPENAI_BASE_URL": stub.url,
+        "OPENAI_API_KEY": "replay",
+        "MISTRAL_ENDPOINT": stub.url,
+        "MISTRAL_API_KEY": "replay",
+        "LOG_LEVEL": args.log_level,
+    })
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    app_module = importlib.import_module("main")
+    if not args.redis_url:
+        import fakeredis
+        app_module.clients.redis_client = fakeredis.FakeAsyncRedis()
+
+    try:
+        asyncio.run(run(args, app_module, recordings["turns"]))
+    finally:
+        stub.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017/")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--redis-url", default=None, help="Use this Redis instead of fakeredis")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--ranker", choices=["local", "llm"], default="local")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--recordings", default=RECORDINGS_PATH)
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--log-level", default="WARNING")
+    main(parser.parse_args())
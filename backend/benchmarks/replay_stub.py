@@ -0,0 +1,312 @@
+"""Stand-in OpenAI Assistants and Mistral chat APIs that replay recorded turns.
+
+The app is pointed here through OPENAI_BASE_URL and MISTRAL_ENDPOINT (see
+replay.py). Each request is answered from recordings.json: the tool call and
+reply recorded for the turn whose message appears in the conversation, after
+the recorded latency for that kind of call (scaled by ``latency_scale``, so 0
+measures the backend alone). Ranking calls return the candidates they were
+given in reverse order.
+
+Only the endpoints the app calls are implemented, with the fields the SDKs read.
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+RECORDINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings.json")
+
+BUSINESS_ID = re.compile(r"business_id='([^']+)'")
+LOCATION_KEY = re.compile(r'"key": "(L\d+)"')
+
+def load_recordings(path: str = RECORDINGS_PATH) -> Dict:
+    with open(path) as file:
+        return json.load(file)
+
+def sse(data, event: Optional[str] = None) -> bytes:
+    prefix = f"event: {event}\n".encode("utf-8") if event else b""
+    payload = data if isinstance(data, bytes) else orjson.dumps(data)
+    return prefix + b"data: " + payload + b"\n\n"
+
+def words(text: str) -> List[str]:
+    # Token-sized pieces that join back into ``text``
+    return re.findall(r"\S+\s*", text)
+
+class Replay:
+    def __init__(self, recordings: Dict, latency_scale: float = 1.0):
+        self.turns = recordings["turns"]
+        self.latency = recordings.get("latency_ms", {})
+        self.latency_scale = latency_scale
+        self.threads: Dict[str, List[Dict]] = {}
+        self.runs: Dict[str, Dict] = {}
+        self._ids = itertools.count(1)
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids):010d}"
+
+    def delay_seconds(self, name: str) -> float:
+        return self.latency.get(name, 0) / 1000 * self.latency_scale
+
+    async def delay(self, name: str) -> None:
+        seconds = self.delay_seconds(name)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def turn_for(self, text: str) -> Dict:
+        for turn in self.turns:
+            if turn["message"] in text:
+                return turn
+        return self.turns[0]
+
+    ##############
+    ### OpenAI ###
+    ##############
+
+    def message_object(self, thread_id: str, role: str, text: str) -> Dict:
+        return {
+            "id": self.new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "status": "completed",
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "assistant_id": None,
+            "run_id": None,
+            "attachments": [],
+            "metadata": {},
+        }
+
+    def run_object(self, thread_id: str, assistant_id: str, status: str, required_action: Optional[Dict] = None) -> Dict:
+        return {
+            "id": self.new_id("run"),
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "status": status,
+            "required_action": required_action,
+            "instructions": "",
+            "model": "gpt-4o",
+            "tools": [],
+            "metadata": {},
+        }
+
+    def last_user_text(self, thread_id: str) -> str:
+        for message in reversed(self.threads.get(thread_id, [])):
+            if message["role"] == "user":
+                return message["content"][0]["text"]["value"]
+        return ""
+
+    async def tool_run_events(self, thread_id: str, assistant_id: str):
+        turn = self.turn_for(self.last_user_text(thread_id))
+        run = self.run_object(thread_id, assistant_id, "queued")
+        self.runs[run["id"]] = run
+        yield sse(run, "thread.run.created")
+        await self.delay("openai_run_start")
+        tool_call = turn["openai_tool_call"]
+        run["status"] = "requires_action"
+        run["required_action"] = {
+            "type": "submit_tool_outputs",
+            "submit_tool_outputs": {"tool_calls": [{
+                "id": self.new_id("call"),
+                "type": "function",
+                "function": {"name": tool_call["name"], "arguments": json.dumps(tool_call["arguments"])},
+            }]},
+        }
+        yield sse(run, "thread.run.requires_action")
+        yield sse(b"[DONE]", "done")
+
+    async def reply_events(self, run: Dict):
+        turn = self.turn_for(self.last_user_text(run["thread_id"]))
+        run["status"] = "in_progress"
+        run["required_action"] = None
+        yield sse(run, "thread.run.in_progress")
+        await self.delay("openai_run_finish")
+        message = self.message_object(run["thread_id"], "assistant", turn["openai_reply"])
+        for piece in words(turn["openai_reply"]):
+            await self.delay("openai_token")
+            yield sse({"id": message["id"], "object": "thread.message.delta",
+                       "delta": {"content": [{"index": 0, "type": "text", "text": {"value": piece, "annotations": []}}]}},
+                      "thread.message.delta")
+        self.threads[run["thread_id"]].append(message)
+        yield sse(message, "thread.message.completed")
+        run["status"] = "completed"
+        yield sse(run, "thread.run.completed")
+        yield sse(b"[DONE]", "done")
+
+    def finish_sort_run(self, run: Dict) -> None:
+        # The sorting run answers with the business ids of the sort message, reversed
+        business_ids = BUSINESS_ID.findall(self.last_user_text(run["thread_id"]))
+        self.threads[run["thread_id"]].append(
+            self.message_object(run["thread_id"], "assistant", ", ".join(reversed(business_ids))))
+        run["status"] = "completed"
+
+    ###############
+    ### Mistral ###
+    ###############
+
+    def mistral_message(self, body: Dict) -> Dict:
+        messages = body.get("messages", [])
+        user_text = next((message.get("content") or "" for message in reversed(messages) if message["role"] == "user"), "")
+        turn = self.turn_for(user_text)
+        if not body.get("tools"):
+            # Sort chain: the location keys it was shown, reversed
+            keys = list(dict.fromkeys(LOCATION_KEY.findall(user_text)))
+            return {"role": "assistant", "content": ", ".join(reversed(keys)), "tool_calls": None}
+        if messages and messages[-1]["role"] == "tool":
+            return {"role": "assistant", "content": turn["mistral_reply"], "tool_calls": None}
+        tool_call = turn["mistral_tool_call"]
+        return {"role": "assistant", "content": "", "tool_calls": [{
+            "id": self.new_id("call")[-9:],
+            "function": {"name": tool_call["name"], "arguments": json.dumps(tool_call["arguments"])},
+        }]}
+
+    @staticmethod
+    def mistral_latency(body: Dict) -> str:
+        if not body.get("tools"):
+            return "mistral_sort"
+        messages = body.get("messages", [])
+        return "mistral_reply" if messages and messages[-1]["role"] == "tool" else "mistral_tool_call"
+
+    async def mistral_chunks(self, completion_id: str, message: Dict):
+        if message["tool_calls"]:
+            deltas = [{"role": "assistant", "content": "",
+                       "tool_calls": [{**call, "index": index} for index, call in enumerate(message["tool_calls"])]}]
+        else:
+            deltas = [{"role": "assistant", "content": piece} for piece in words(message["content"])]
+        for delta in deltas:
+            await self.delay("mistral_token")
+            yield sse({"id": completion_id, "object": "chat.completion.chunk",
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        yield sse({"id": completion_id, "object": "chat.completion.chunk",
+                   "choices": [{"index": 0, "delta": {"content": ""},
+                                "finish_reason": "tool_calls" if message["tool_calls"] else "stop"}]})
+        yield sse(b"[DONE]")
+
+def create_stub_app(replay: Replay) -> FastAPI:
+    app = FastAPI()
+
+    def event_stream(events):
+        return StreamingResponse(events, media_type="text/event-stream")
+
+    @app.post("/v1/assistants")
+    async def create_assistant(request: Request):
+        body = await request.json()
+        await replay.delay("openai_api")
+        return ORJSONResponse({"id": replay.new_id("asst"), "object": "assistant", "created_at": int(time.time()),
+                               "model": body.get("model", "gpt-4o"), "name": body.get("name"),
+                               "instructions": body.get("instructions"), "tools": body.get("tools", []),
+                               "metadata": {}})
+
+    @app.post("/v1/threads")
+    async def create_thread():
+        await replay.delay("openai_api")
+        thread_id = replay.new_id("thread")
+        replay.threads[thread_id] = []
+        return ORJSONResponse({"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}})
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def create_message(thread_id: str, request: Request):
+        body = await request.json()
+        await replay.delay("openai_api")
+        message = replay.message_object(thread_id, body.get("role", "user"), body["content"])
+        replay.threads.setdefault(thread_id, []).append(message)
+        return ORJSONResponse(message)
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str):
+        await replay.delay("openai_api")
+        data = list(reversed(replay.threads.get(thread_id, [])))
+        return ORJSONResponse({"object": "list", "data": data, "has_more": False,
+                               "first_id": data[0]["id"] if data else None,
+                               "last_id": data[-1]["id"] if data else None})
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        body = await request.json()
+        if body.get("stream"):
+            return event_stream(replay.tool_run_events(thread_id, body["assistant_id"]))
+        # Only the sorting run is created without streaming
+        await replay.delay("openai_api")
+        run = replay.run_object(thread_id, body["assistant_id"], "queued")
+        run["ready_at"] = time.monotonic() + replay.delay_seconds("openai_sort_run")
+        replay.runs[run["id"]] = run
+        return ORJSONResponse(run)
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def retrieve_run(thread_id: str, run_id: str):
+        await replay.delay("openai_api")
+        run = replay.runs[run_id]
+        if run["status"] in ("queued", "in_progress"):
+            if time.monotonic() >= run.get("ready_at", 0):
+                replay.finish_sort_run(run)
+            else:
+                run["status"] = "in_progress"
+        return ORJSONResponse(run)
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+    async def submit_tool_outputs(thread_id: str, run_id: str):
+        return event_stream(replay.reply_events(replay.runs[run_id]))
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+    async def cancel(thread_id: str, run_id: str):
+        run = replay.runs[run_id]
+        run["status"] = "cancelled"
+        return ORJSONResponse(run)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await replay.delay(replay.mistral_latency(body))
+        message = replay.mistral_message(body)
+        completion_id = replay.new_id("cmpl")
+        if body.get("stream"):
+            return event_stream(replay.mistral_chunks(completion_id, message))
+        return ORJSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message["tool_calls"] else "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    return app
+
+class StubServer:
+    """Serves the stub app from a background thread on a free local port."""
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1"):
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=0, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.host = host
+        self.port: Optional[int] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self, timeout: float = 10.0) -> "StubServer":
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Replay stub server did not start")
+            time.sleep(0.01)
+        self.port = self.server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join()
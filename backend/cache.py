@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from bson import json_util
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+###############
+### Geohash ###
+###############
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 6) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(geohash)
+
+def geohash_bounds(geohash: str) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    """Return the ((south, north), (west, east)) edges of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if (bits >> shift) & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return (lat_range[0], lat_range[1]), (lon_range[0], lon_range[1])
+
+def geohash_decode(geohash: str) -> Tuple[float, float]:
+    """Return the (latitude, longitude) center of a geohash cell."""
+    lat_range, lon_range = geohash_bounds(geohash)
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+#################
+### LRU cache ###
+#################
+
+class LRUCache:
+    """Small in-process LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+#############################
+### Nearby location cache ###
+#############################
+
+class NearbyLocationsCache:
+    """Candidate sets for nearby-location queries, keyed by geohash tile.
+
+    Lookups go to an in-process LRU first and then to Redis. Queries are run
+    from the center of the caller's tile over a radius widened to cover the
+    whole tile, so everyone in the same tile with the same filters shares one
+    entry; each caller then keeps what is within their own radius.
+    """
+
+    def __init__(self, redis_client: Redis, key_prefix: str = "nearby:", ttl: int = 300,
+                 local_maxsize: int = 512, local_ttl: float = 30.0):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=local_maxsize, ttl=local_ttl)
+        self.counters = {"local_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+
+    @staticmethod
+    def tile_precision(radius: float) -> int:
+        # ~150m tiles for short walks, ~1.2km tiles otherwise
+        return 7 if radius < 5000 else 6
+
+    def key(self, latitude: float, longitude: float, **filters) -> Tuple[str, Tuple[float, float]]:
+        """Return the cache key and the tile center to query from (see tile_bounds for the tile itself)."""
+        tile = geohash_encode(latitude, longitude, self.tile_precision(filters.get("radius", 0)))
+        digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+        return f"{self.key_prefix}{tile}:{digest}", geohash_decode(tile)
+
+    def tile_bounds(self, latitude: float, longitude: float, radius: float):
+        return geohash_bounds(geohash_encode(latitude, longitude, self.tile_precision(radius)))
+
+    async def get(self, key: str) -> Optional[List[Dict]]:
+        items = self.local.get(key)
+        if items is not None:
+            self.counters["local_hits"] += 1
+            return items
+        try:
+            payload = await self.redis_client.get(key)
+        except RedisError:
+            self.counters["redis_errors"] += 1
+            payload = None
+        if payload is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["redis_hits"] += 1
+        items = json_util.loads(payload)
+        self.local.set(key, items)
+        return items
+
+    async def set(self, key: str, items: List[Dict], ttl: Optional[int] = None) -> None:
+        self.local.set(key, items, ttl=min(self.local.ttl, ttl) if ttl else None)
+        try:
+            await self.redis_client.set(key, json_util.dumps(items), ex=ttl or self.ttl)
+        except RedisError:
+            self.counters["redis_errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["local_hits"] + self.counters["redis_hits"] + self.counters["misses"]
+        hits = self.counters["local_hits"] + self.counters["redis_hits"]
+        return {**self.counters, "local_entries": len(self.local), "hit_rate": hits / lookups if lookups else 0.0}
+
+####################
+### Intent cache ###
+####################
+
+# Upper bounds (meters) that tool-call radii are rounded up to
+RADIUS_BUCKETS = (1000, 2500, 5000, 10000, 20000, 50000, 100000)
+
+# Width of the "open now" bucket in minutes; open-only entries live at most this long
+OPEN_BUCKET_MINUTES = 15
+
+def radius_bucket(radius: float) -> int:
+    return next((bucket for bucket in RADIUS_BUCKETS if radius <= bucket), RADIUS_BUCKETS[-1])
+
+class IntentCache(NearbyLocationsCache):
+    """Ranked recommendations for a normalized search intent.
+
+    Near-duplicate requests ("I want coffee", "coffee nearby?") from the same
+    area end up as the same tool arguments once tags are matched. The key is
+    built from those arguments (matched tags, radius bucket, geohash tile,
+    open-now bucket), so a repeat intent reuses the ranking of an earlier turn
+    without querying Mongo or calling the sort model.
+    """
+
+    def __init__(self, redis_client: Redis, key_prefix: str = "intent:", ttl: int = 300,
+                 local_maxsize: int = 1024, local_ttl: float = 30.0):
+        super().__init__(redis_client, key_prefix=key_prefix, ttl=ttl, local_maxsize=local_maxsize, local_ttl=local_ttl)
+
+    def intent_key(self, latitude: float, longitude: float, tags: List[str], radius: float,
+                   open_at: Optional[int] = None, **extra) -> str:
+        intent = {
+            "tags": sorted({tag.strip().lower() for tag in tags or [] if tag and tag.strip()}),
+            "radius": radius_bucket(radius),
+            "open": open_at // OPEN_BUCKET_MINUTES if open_at is not None else None,
+            **extra,
+        }
+        key, _ = self.key(latitude, longitude, **intent)
+        return key
+
+    def entry_ttl(self, open_at: Optional[int] = None) -> int:
+        return min(self.ttl, OPEN_BUCKET_MINUTES * 60) if open_at is not None else self.ttl
+
+#####################
+### Single flight ###
+#####################
+
+class SingleFlight:
+    """Collapses concurrent loads of the same key into one shared task."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+        # A cancelled caller must not cancel the load other callers are waiting on
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable) -> None:
+        self._inflight.pop(key, None)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+##########################
+### User profile cache ###
+##########################
+
+_MISSING = object()
+
+class UserProfileCache:
+    """Short-lived in-process cache of user documents with single-flight loads.
+
+    Writers call invalidate(); a load that was already running when the
+    invalidation happened is returned to its callers but not cached.
+    """
+
+    def __init__(self, ttl: float = 5.0, maxsize: int = 4096):
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.flights = SingleFlight()
+        self._generations: Dict[str, int] = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+
+    async def get(self, user_id: str, load: Callable[[], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        profile = self.local.get(user_id, _MISSING)
+        if profile is not _MISSING:
+            self.counters["hits"] += 1
+            return dict(profile) if profile is not None else None
+
+        if user_id in self.flights:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+        generation = self._generations.get(user_id, 0)
+
+        async def load_and_store():
+            loaded = await load()
+            if self._generations.get(user_id, 0) == generation:
+                self.local.set(user_id, loaded)
+            return loaded
+
+        profile = await self.flights.do(user_id, load_and_store)
+        return dict(profile) if profile is not None else None
+
+    def invalidate(self, user_id: str) -> None:
+        self.counters["invalidations"] += 1
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self.local.invalidate(user_id)
+        self.flights.forget(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {**self.counters, "entries": len(self.local),
+                "hit_rate": (self.counters["hits"] + self.counters["coalesced"]) / lookups if lookups else 0.0}
@@ -0,0 +1,129 @@
+import asyncio
+from functools import cached_property
+from typing import Optional
+
+import motor.motor_asyncio
+import pymongo
+import redis.asyncio
+from openai import AsyncOpenAI
+
+from cache import IntentCache, NearbyLocationsCache
+from config import Settings
+from location_index import LocationNameIndex, get_location_name_index
+from mistral_utils import SessionStore, initalize_chat_model, initalize_sort_model
+from utils import provision_assistant_id
+
+class Clients:
+    """External clients shared by the app, each created on first use.
+
+    Nothing here connects or validates credentials at import time. Tests and
+    benchmarks can assign stand-ins (mongomock, fakeredis, stub OpenAI) to any
+    attribute before it is first read.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._assistant_id: Optional[str] = None
+        self._assistant_lock: Optional[asyncio.Lock] = None
+
+    ###############
+    ### MongoDB ###
+    ###############
+
+    @cached_property
+    def mongo_client(self) -> motor.motor_asyncio.AsyncIOMotorClient:
+        return motor.motor_asyncio.AsyncIOMotorClient(self.settings.mongo_url)
+
+    @cached_property
+    def db(self):
+        return self.mongo_client[self.settings.mongo_database]
+
+    # MongoDB without async, only for background threads (name index refresh)
+    @cached_property
+    def mongo_client_reg(self) -> pymongo.MongoClient:
+        return pymongo.MongoClient(self.settings.mongo_url)
+
+    @cached_property
+    def db_reg(self):
+        return self.mongo_client_reg[self.settings.mongo_database]
+
+    #############
+    ### Redis ###
+    #############
+
+    @cached_property
+    def redis_client(self) -> redis.asyncio.Redis:
+        return redis.asyncio.Redis.from_url(self.settings.redis_url)
+
+    @cached_property
+    def nearby_cache(self) -> NearbyLocationsCache:
+        return NearbyLocationsCache(self.redis_client)
+
+    @cached_property
+    def session_store(self) -> SessionStore:
+        return SessionStore(self.redis_client)
+
+    @cached_property
+    def intent_cache(self) -> IntentCache:
+        return IntentCache(self.redis_client)
+
+    ##############
+    ### OpenAI ###
+    ##############
+
+    @cached_property
+    def openai_client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=self.settings.openai_api_key, base_url=self.settings.openai_base_url)
+
+    async def assistant_id(self) -> str:
+        if self._assistant_id is None:
+            # Created here rather than in __init__ so it binds to the running loop
+            if self._assistant_lock is None:
+                self._assistant_lock = asyncio.Lock()
+            async with self._assistant_lock:
+                if self._assistant_id is None:
+                    self._assistant_id = await provision_assistant_id(self.openai_client, self.redis_client)
+        return self._assistant_id
+
+    ###############
+    ### Mistral ###
+    ###############
+
+    @property
+    def mistral_api_key(self) -> str:
+        if not self.settings.mistral_api_key:
+            raise RuntimeError("MISTRAL_API_KEY is not set")
+        return self.settings.mistral_api_key
+
+    @cached_property
+    def locations_name_index(self) -> LocationNameIndex:
+        return get_location_name_index(self.db_reg["locationsv2"], start=False)
+
+    @cached_property
+    def sort_model(self):
+        return initalize_sort_model(model_name=self.settings.sort_model_name, api_key=self.mistral_api_key,
+                                    endpoint=self.settings.mistral_endpoint)
+
+    # Shared agent; per-request location and session are passed through use_chat_context
+    @cached_property
+    def chat_model(self):
+        return initalize_chat_model(model_name=self.settings.chat_model_name,
+                                    api_key=self.mistral_api_key,
+                                    locations_db=self.db["locationsv2"],
+                                    name_index=self.locations_name_index,
+                                    sort_model=self.sort_model,
+                                    intent_cache=self.intent_cache,
+                                    endpoint=self.settings.mistral_endpoint)
+
+    async def aclose(self) -> None:
+        created = self.__dict__
+        if "locations_name_index" in created:
+            self.locations_name_index.stop()
+        if "redis_client" in created:
+            await self.redis_client.aclose()
+        if "openai_client" in created:
+            await self.openai_client.close()
+        if "mongo_client" in created:
+            self.mongo_client.close()
+        if "mongo_client_reg" in created:
+            self.mongo_client_reg.close()
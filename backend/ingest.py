@@ -0,0 +1,311 @@
+"""Bulk loader for the location collections.
+
+Usage (from backend/):
+    python ingest.py businesses.jsonl --mongo-url mongodb://localhost:27017/
+    python ingest.py businesses.csv --collections locations --batch-size 2000 --workers 4
+
+Reads Yelp-style business records from JSONL or CSV in batches, derives the
+fields the query paths rely on (GeoJSON ``location``, tags from the category
+aliases, category keys, ``open_intervals``) and upserts them by
+``business_id`` with unordered bulk writes, several batches in flight at once.
+Indexes are created at the end with the helpers in migrations.py, so a run on
+an empty collection does not maintain them row by row.
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+import pymongo
+from pymongo import UpdateOne
+
+from migrations import (DATABASE_NAME, DEFAULT_MONGO_URL, LOCATION_COLLECTIONS, create_category_indexes,
+                        create_open_interval_indexes, derive_category_keys, derive_open_intervals)
+from utils import WEEKDAYS
+from vocabulary import vocabulary_registry
+
+###############
+### Reading ###
+###############
+
+def read_jsonl(file) -> Iterator[Dict]:
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+# Columns whose cells may hold JSON (hours, attributes, category and tag lists); other text is kept as is
+CSV_JSON_COLUMNS = ("hours", "attributes", "categories", "tag", "tags")
+
+def _csv_value(key: str, value: str):
+    if key in CSV_JSON_COLUMNS and value[:1] in ("{", "["):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    return value
+
+def read_csv(file) -> Iterator[Dict]:
+    for row in csv.DictReader(file):
+        yield {key: _csv_value(key, value) for key, value in row.items() if value not in (None, "")}
+
+READERS = {".jsonl": read_jsonl, ".json": read_jsonl, ".csv": read_csv}
+
+def batches(records: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+######################
+### Derived fields ###
+######################
+
+_TAG_CHARACTERS = re.compile(r"[^a-z0-9_]")
+_TITLE_WORD = re.compile(r"[a-z0-9]+")
+_YELP_TIME = re.compile(r"^(\d{1,2}):(\d{1,2})$")
+
+# Yelp category titles whose alias is not built from their words
+TITLE_ALIASES = {
+    "american (new)": "newamerican",
+    "american (traditional)": "tradamerican",
+    "barbeque": "bbq",
+    "beauty & spas": "beautysvc",
+    "beer, wine & spirits": "beer_and_wine",
+    # What the dataset's comma-separated strings leave of "Beer, Wine & Spirits"
+    "wine & spirits": "beer_and_wine",
+    "steakhouses": "steak",
+}
+
+def split_values(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [part.strip() for part in value if isinstance(part, str) and part.strip()]
+
+def category_titles(categories) -> List[str]:
+    # Yelp dataset: "Coffee & Tea, Cafes"; Yelp Fusion: [{"alias": "coffee", "title": "Coffee & Tea"}]
+    if isinstance(categories, list) and any(isinstance(category, dict) for category in categories):
+        return split_values([category.get("title") for category in categories if isinstance(category, dict)])
+    return split_values(categories)
+
+def category_aliases(categories) -> List[str]:
+    if not isinstance(categories, list):
+        return []
+    return [category["alias"] for category in categories if isinstance(category, dict) and category.get("alias")]
+
+def normalize_tags(values) -> List[str]:
+    tags = {}
+    for value in split_values(values):
+        tag = _TAG_CHARACTERS.sub("", value.lower())
+        if tag:
+            tags[tag] = None
+    return list(tags)
+
+def title_alias(title: str, vocabulary=None) -> Optional[str]:
+    """The tags.json alias of a Yelp category title, or None when it has none.
+
+    Aliases are the title's words joined with or without underscores ("Breakfast & Brunch" ->
+    "breakfast_brunch", "Hot Dogs" -> "hotdogs"), or those of its leading words ("Coffee & Tea" ->
+    "coffee", "Sushi Bars" -> "sushi"); only candidates in the vocabulary are accepted."""
+    vocabulary = vocabulary_registry.tags if vocabulary is None else vocabulary
+    title = title.strip().lower()
+    if title in TITLE_ALIASES:
+        return TITLE_ALIASES[title]
+    words = _TITLE_WORD.findall(title.replace("&", " and "))
+    for count in range(len(words), 0, -1):
+        leading = words[:count]
+        # "and" only survives inside an alias ("beer_and_wine"), never at its end
+        if leading[-1] == "and":
+            continue
+        for candidate in ("_".join(leading), "".join(leading), "_".join(word for word in leading if word != "and")):
+            if candidate in vocabulary:
+                return candidate
+    return None
+
+def category_tags(categories, vocabulary=None) -> List[str]:
+    """Tags of a record's categories: the Yelp aliases when present, else the aliases of the titles."""
+    aliases = category_aliases(categories)
+    if aliases:
+        return normalize_tags(aliases)
+    tags = {}
+    for title in category_titles(categories):
+        tag = title_alias(title, vocabulary)
+        if tag is not None:
+            tags[tag] = None
+    return list(tags)
+
+def _hhmm(value: str) -> Optional[str]:
+    value = value.strip()
+    if len(value) == 4 and value.isdigit():
+        return value
+    match = _YELP_TIME.match(value)
+    if match is None:
+        return None
+    return f"{int(match.group(1)) % 24:02d}{int(match.group(2)):02d}"
+
+# Accepts {"Monday": ["0800", "1700"]} as stored, or the Yelp dataset's {"Monday": "8:0-17:0"}
+def normalize_hours(hours) -> Optional[Dict[str, List[str]]]:
+    if not isinstance(hours, dict):
+        return None
+    normalized = {}
+    for day in WEEKDAYS:
+        value = hours.get(day)
+        if isinstance(value, str):
+            value = value.split("-")
+        if not isinstance(value, list) or len(value) != 2:
+            continue
+        open_time, close_time = _hhmm(str(value[0])), _hhmm(str(value[1]))
+        if open_time is not None and close_time is not None:
+            normalized[day] = [open_time, close_time]
+    return normalized
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _price(record: Dict) -> Optional[str]:
+    price = record.get("price")
+    if price is None:
+        # Yelp dataset: attributes.RestaurantsPriceRange2 = "1".."4"
+        level = (record.get("attributes") or {}).get("RestaurantsPriceRange2")
+        price = "$" * int(level) if str(level).isdigit() else None
+    return price or None
+
+def location_document(record: Dict) -> Optional[Dict]:
+    """Shape one raw record like a ``locations`` document, or None if it cannot be placed on the map."""
+    latitude, longitude = _float(record.get("latitude")), _float(record.get("longitude"))
+    if not record.get("business_id") or latitude is None or longitude is None:
+        return None
+    categories = category_titles(record.get("categories"))
+    hours = normalize_hours(record.get("hours"))
+    document = {
+        "business_id": str(record["business_id"]),
+        "name": record.get("name"),
+        "image_url": record.get("image_url"),
+        "phone": record.get("phone"),
+        "display_phone": record.get("display_phone"),
+        "address": record.get("address"),
+        "city": record.get("city"),
+        "state": record.get("state"),
+        "postal_code": record.get("postal_code"),
+        "latitude": latitude,
+        "longitude": longitude,
+        "location": {"type": "Point", "coordinates": [longitude, latitude]},
+        "stars": _float(record.get("stars")),
+        "review_count": int(_float(record.get("review_count")) or 0),
+        # The Yelp dataset's is_open marks businesses that have not closed for good
+        "cur_open": int(_float(record.get("cur_open", record.get("is_open", 1))) or 0),
+        "categories": [", ".join(categories)] if categories else [],
+        "tag": normalize_tags(record.get("tag") or record.get("tags")) or category_tags(record.get("categories")),
+        "hours": hours,
+        "price": _price(record),
+        "summary": record.get("summary"),
+    }
+    document.update(derive_category_keys(document))
+    document.update(derive_open_intervals(document))
+    return document
+
+def location_v2_document(document: Dict) -> Dict:
+    # locationsv2 (Mistral agent) keeps tags under "tags" and the price level as a number
+    v2 = {key: value for key, value in document.items() if key not in ("tag", "category_keys")}
+    v2["tags"] = document["tag"]
+    v2["price"] = len(document["price"]) if document["price"] else None
+    return v2
+
+DOCUMENT_BUILDERS = {
+    "locations": lambda document: document,
+    "locationsv2": location_v2_document,
+}
+
+###############
+### Writing ###
+###############
+
+def write_batch(db, collections: List[str], records: List[Dict]):
+    documents = []
+    rejected = 0
+    for record in records:
+        document = location_document(record)
+        if document is None:
+            rejected += 1
+        else:
+            documents.append(document)
+    for name in collections:
+        build = DOCUMENT_BUILDERS[name]
+        operations = [UpdateOne({"business_id": document["business_id"]}, {"$set": build(document)}, upsert=True)
+                      for document in documents]
+        if operations:
+            db[name].bulk_write(operations, ordered=False)
+    return len(documents), rejected
+
+def create_ingest_indexes(db, collections: List[str]):
+    for name in collections:
+        create_open_interval_indexes(db[name])
+    if "locations" in collections:
+        create_category_indexes(db["locations"])
+    if "locationsv2" in collections:
+        # The agent's $geoNear filters on tags
+        db["locationsv2"].create_index([("location", pymongo.GEOSPHERE), ("tags", pymongo.ASCENDING)],
+                                       name="location_tags")
+
+def ingest(db, records: Iterator[Dict], collections: List[str], batch_size: int = 1000, workers: int = 4,
+           report_every: int = 100000):
+    # Upserts look documents up by business_id, so that index has to exist first
+    for name in collections:
+        db[name].create_index("business_id", name="business_id")
+
+    start = time.time()
+    written = rejected = reported = 0
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batches(records, batch_size):
+            pending.append(executor.submit(write_batch, db, collections, batch))
+            # Bound the batches held in memory while the writers catch up
+            while len(pending) > workers * 2:
+                batch_written, batch_rejected = pending.pop(0).result()
+                written += batch_written
+                rejected += batch_rejected
+            if written - reported >= report_every:
+                reported = written
+                print(f"{written} documents ({written / (time.time() - start):.0f} docs/s)")
+        for future in pending:
+            batch_written, batch_rejected = future.result()
+            written += batch_written
+            rejected += batch_rejected
+    load_seconds = time.time() - start
+
+    index_start = time.time()
+    create_ingest_indexes(db, collections)
+    index_seconds = time.time() - index_start
+    print(f"{', '.join(collections)}: {written} documents upserted, {rejected} rejected in {load_seconds:.1f}s "
+          f"({written / max(load_seconds, 1e-9):.0f} docs/s), indexes built in {index_seconds:.1f}s")
+    return written, rejected
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JSONL or CSV file, or - for JSONL on stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Defaults to the file extension")
+    parser.add_argument("--mongo-url", default=DEFAULT_MONGO_URL)
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--collections", nargs="+", choices=LOCATION_COLLECTIONS, default=LOCATION_COLLECTIONS)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    reader = READERS[f".{args.format}"] if args.format else READERS.get(args.path[args.path.rfind("."):], read_jsonl)
+    db = pymongo.MongoClient(args.mongo_url)[args.database]
+    if args.path == "-":
+        ingest(db, reader(sys.stdin), args.collections, args.batch_size, args.workers)
+    else:
+        with open(args.path, newline="") as file:
+            ingest(db, reader(file), args.collections, args.batch_size, args.workers)
@@ -0,0 +1,247 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure, PyMongoError
+from rapidfuzz import process, fuzz
+
+logger = logging.getLogger(__name__)
+
+# Fields returned for a name lookup (mirrors what the agent tools read)
+LOCATION_NAME_PROJECTION = {
+    "_id": 1,
+    "business_id": 1,
+    "name": 1,
+    "image_url": 1,
+    "address": 1,
+    "stars": 1,
+    "review_count": 1,
+    "cur_open": 1,
+    "phone": 1,
+    "display_phone": 1,
+    "summary": 1,
+    "tags": 1,
+    "hours": 1,
+    "open_intervals": 1,
+    "location": 1,
+}
+
+# $changeStream is only supported on replica sets and sharded clusters
+CHANGE_STREAM_UNSUPPORTED_CODES = (40573,)
+# The resume point has left the oplog (ChangeStreamHistoryLost, ChangeStreamFatalError)
+CHANGE_STREAM_LOST_CODES = (286, 280)
+# Seconds between attempts to reopen a failed change stream, doubling up to the maximum
+CHANGE_STREAM_RETRY_MIN = 1.0
+CHANGE_STREAM_RETRY_MAX = 60.0
+
+def _project(document: Dict) -> Dict:
+    return {key: document[key] for key in LOCATION_NAME_PROJECTION if key in document}
+
+class LocationNameIndex:
+    """Process-resident fuzzy index of business names for one collection.
+
+    The full collection is read once, after which the index is kept current by a
+    background thread that follows a change stream, or polls for new documents by
+    ``_id`` when change streams are unsupported (standalone mongod). A stream that
+    fails is reopened from its last resume token with backoff. Lookups never
+    touch Mongo.
+    """
+
+    def __init__(self, collection: Collection, refresh_interval: float = 60.0, use_change_stream: bool = True):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.use_change_stream = use_change_stream
+
+        self._lock = threading.RLock()
+        self._docs: Dict[Any, Dict] = {}
+        self._ids_by_name: Dict[str, List[Any]] = {}
+        self._names: Optional[List[str]] = None
+        self._last_id = None
+        self._resume_token = None
+        self._reload = False
+        self._loaded = False
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    ###############
+    ### Lookups ###
+    ###############
+
+    def search(self, business_name: str) -> Optional[Dict]:
+        """Return the document whose name best matches ``business_name``."""
+        with self._lock:
+            ids = self._ids_by_name.get(business_name)
+            if ids is None:
+                if self._names is None:
+                    self._names = list(self._ids_by_name)
+                names = self._names
+            else:
+                return self._public(self._docs[ids[0]])
+
+        best_match = process.extractOne(business_name, names, scorer=fuzz.ratio)
+        if not best_match:
+            return None
+
+        with self._lock:
+            ids = self._ids_by_name.get(best_match[0])
+            return self._public(self._docs[ids[0]]) if ids else None
+
+    @staticmethod
+    def _public(document: Dict) -> Dict:
+        return {key: value for key, value in document.items() if key != "_id"}
+
+    ###############
+    ### Updates ###
+    ###############
+
+    def load(self) -> None:
+        """(Re)build the index from a full scan of the collection."""
+        documents = list(self.collection.find({}, LOCATION_NAME_PROJECTION).sort("_id", 1))
+        with self._lock:
+            self._docs = {}
+            self._ids_by_name = {}
+            self._names = None
+            self._last_id = None
+            for document in documents:
+                self._upsert(document)
+            self._loaded = True
+
+    def apply(self, documents: List[Dict]) -> None:
+        with self._lock:
+            for document in documents:
+                self._upsert(document)
+
+    def remove(self, document_id: Any) -> None:
+        with self._lock:
+            self._remove(document_id)
+
+    def _upsert(self, document: Dict) -> None:
+        document_id = document["_id"]
+        name = document.get("name")
+        self._remove(document_id)
+        if self._last_id is None or document_id > self._last_id:
+            self._last_id = document_id
+        if not isinstance(name, str):
+            return
+        self._docs[document_id] = _project(document)
+        ids = self._ids_by_name.setdefault(name, [])
+        if not ids:
+            self._names = None
+        ids.append(document_id)
+        # find_one() on a duplicated name returned the oldest document, keep that
+        ids.sort()
+
+    def _remove(self, document_id: Any) -> None:
+        previous = self._docs.pop(document_id, None)
+        if previous is None:
+            return
+        ids = self._ids_by_name.get(previous["name"], [])
+        if document_id in ids:
+            ids.remove(document_id)
+        if not ids:
+            self._ids_by_name.pop(previous["name"], None)
+            self._names = None
+
+    ##########################
+    ### Background refresh ###
+    ##########################
+
+    def ensure_started(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            if self._thread is None and self.refresh_interval:
+                self._thread = threading.Thread(target=self._run, name=f"name-index-{self.collection.name}", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def refresh_delta(self) -> None:
+        """Pull documents inserted since the last seen ``_id``."""
+        query = {"_id": {"$gt": self._last_id}} if self._last_id is not None else {}
+        documents = list(self.collection.find(query, LOCATION_NAME_PROJECTION).sort("_id", 1))
+        if documents:
+            self.apply(documents)
+
+    def _run(self) -> None:
+        retry_delay = CHANGE_STREAM_RETRY_MIN
+        while not self._stop.is_set():
+            if self.use_change_stream:
+                try:
+                    self._follow_change_stream()
+                    retry_delay = CHANGE_STREAM_RETRY_MIN
+                    continue
+                except OperationFailure as e:
+                    if e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                        logger.info("Change streams unsupported for %s, polling instead: %s", self.collection.full_name, e)
+                        self.use_change_stream = False
+                        continue
+                    if e.code in CHANGE_STREAM_LOST_CODES:
+                        # Changes were missed for good, so the next stream starts over from a full scan
+                        logger.warning("Change stream for %s cannot resume, reloading: %s", self.collection.full_name, e)
+                        self._resume_token = None
+                        self._reload = True
+                        continue
+                    logger.warning("Change stream for %s failed, retrying in %.0fs: %s",
+                                   self.collection.full_name, retry_delay, e)
+                except PyMongoError as e:
+                    # Network errors, elections and the like: reopen where the stream left off
+                    logger.warning("Change stream for %s failed, retrying in %.0fs: %s",
+                                   self.collection.full_name, retry_delay, e)
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, CHANGE_STREAM_RETRY_MAX)
+                continue
+            try:
+                self.refresh_delta()
+            except PyMongoError as e:
+                logger.warning("Name index refresh failed for %s: %s", self.collection.full_name, e)
+            self._stop.wait(self.refresh_interval)
+
+    def _follow_change_stream(self) -> None:
+        with self.collection.watch(full_document="updateLookup", resume_after=self._resume_token) as stream:
+            if self._reload:
+                # Changes made during the scan are replayed by the stream
+                self.load()
+                self._reload = False
+            elif self._resume_token is None:
+                # Catch anything written between the initial load and the stream opening
+                self.refresh_delta()
+            while not self._stop.is_set():
+                change = stream.try_next()
+                # Advances on empty batches too, so a reopened stream skips nothing already seen
+                self._resume_token = stream.resume_token
+                if change is None:
+                    self._stop.wait(1.0)
+                    continue
+                operation = change["operationType"]
+                if operation in ("insert", "update", "replace") and change.get("fullDocument"):
+                    self.apply([change["fullDocument"]])
+                elif operation == "delete":
+                    self.remove(change["documentKey"]["_id"])
+                elif operation in ("drop", "rename", "invalidate"):
+                    self._resume_token = None
+                    self.load()
+                    return
+
+_indexes: Dict[str, LocationNameIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_location_name_index(collection: Collection, start: bool = True) -> LocationNameIndex:
+    """Return the shared name index for ``collection``, loading it unless ``start`` is False."""
+    with _indexes_lock:
+        index = _indexes.get(collection.full_name)
+        if index is None:
+            index = LocationNameIndex(collection)
+            _indexes[collection.full_name] = index
+    if start:
+        index.ensure_started()
+    return index
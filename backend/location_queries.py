@@ -0,0 +1,254 @@
+import base64
+import hashlib
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+from bson import ObjectId, json_util
+
+from utils import is_open_at, normalize_categories, open_at_query, open_during_query
+
+# "regex" filters the legacy categories strings, "array" the indexed category_keys field. Only set
+# CATEGORY_QUERY_MODE=array once `python migrations.py category_keys` has run: documents without
+# category_keys never match an array query.
+CATEGORY_QUERY_MODE = os.getenv("CATEGORY_QUERY_MODE", "regex")
+
+def build_nearby_query(latitude: float,
+                       longitude: float,
+                       radius: float,
+                       categories: List[str],
+                       tag: List[str],
+                       open_at: Optional[int] = None,
+                       category_mode: Optional[str] = None,
+                       open_until: Optional[int] = None):
+    query = {
+        "location": {
+            "$nearSphere": {
+                "$geometry": {
+                    "type": "Point",
+                    "coordinates": [longitude, latitude]
+                },
+                "$maxDistance": radius
+            }
+        },
+    }
+
+    if categories != ["any"]:
+        if (category_mode or CATEGORY_QUERY_MODE) == "regex":
+            regex_pattern = '|'.join(f"(^|, ){re.escape(cat)}(,|$)" for cat in categories)
+            query["categories"] = {"$regex": regex_pattern, "$options": "i"}
+        else:
+            query["category_keys"] = {"$in": normalize_categories(categories)}
+
+    if open_at is not None:
+        query["cur_open"] = 1
+        # With open_until, locations open at any minute from open_at to open_until
+        query["open_intervals"] = open_at_query(open_at) if open_until is None else open_during_query(open_at, open_until)
+
+    if tag:
+        query["tag"] = {"$all": tag}
+
+    return query
+
+# Mongo projection holding exactly the fields of a Pydantic output model
+def model_projection(model):
+    projection = {"_id": 0}
+    projection.update({field: 1 for field in model.model_fields})
+    return projection
+
+#########################
+### Keyset pagination ###
+#########################
+
+# Set by the $geoNear stage of distance-ordered pages
+DISTANCE_FIELD = "_distance"
+# Seeded sample position of a document (see sample_priority)
+SAMPLE_FIELD = "_sample_key"
+
+def encode_cursor(state: Dict) -> str:
+    payload = json_util.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def decode_cursor(cursor: str, sort_by: str) -> Dict:
+    """Inverse of encode_cursor for a ``sort_by`` page; raises ValueError for anything that is not one of our cursors.
+
+    Cursors are not signed, so every value that reaches a query is type checked: a forged
+    cursor must not be able to inject operators or make the lookup fail."""
+    try:
+        state = json_util.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(state, dict) or not isinstance(state.get("scope"), str) or not isinstance(state.get("id"), ObjectId):
+        raise ValueError("Malformed cursor")
+    if sort_by == "distance":
+        seen = state.get("seen")
+        if (not _is_number(state.get("distance")) or state["distance"] < 0 or not isinstance(seen, list)
+                or not all(isinstance(document_id, ObjectId) for document_id in seen)):
+            raise ValueError("Malformed cursor")
+    elif sort_by == "random":
+        if not isinstance(state.get("key"), int) or isinstance(state["key"], bool):
+            raise ValueError("Malformed cursor")
+    elif "key" not in state or not (state["key"] is None or isinstance(state["key"], str) or _is_number(state["key"])):
+        raise ValueError("Malformed cursor")
+    return state
+
+def page_state(items: List[Dict], sort_by: str, after: Optional[Dict] = None) -> Dict:
+    """Cursor state continuing after the last of ``items`` (fetched with their _id and sort key)."""
+    last = items[-1]
+    state = {"id": last["_id"]}
+    if sort_by == "distance":
+        # Everything already returned at the boundary distance is excluded from the next page
+        state["distance"] = last[DISTANCE_FIELD]
+        state["seen"] = [item["_id"] for item in items if item[DISTANCE_FIELD] == state["distance"]]
+        if after is not None and after.get("distance") == state["distance"]:
+            state["seen"] += after["seen"]
+    elif sort_by == "random":
+        state["key"] = last[SAMPLE_FIELD]
+    else:
+        state["key"] = last.get(sort_by)
+    return state
+
+def next_cursor(state: Dict, scope: str) -> str:
+    return encode_cursor({"scope": scope, **state})
+
+# Documents after ``after`` in (sort_by descending, _id ascending) order; missing keys sort last
+def keyset_filter(sort_by: str, after: Dict) -> Dict:
+    key = after.get("key")
+    if key is None:
+        return {sort_by: None, "_id": {"$gt": after["id"]}}
+    return {"$or": [
+        {sort_by: {"$lt": key}},
+        {sort_by: key, "_id": {"$gt": after["id"]}},
+        {sort_by: None},
+    ]}
+
+# Nearest-first page of ``query`` (from build_nearby_query) as a $geoNear pipeline, resuming at after["distance"]
+def nearby_distance_pipeline(query: Dict, limit: int, projection: Dict, after: Optional[Dict] = None) -> List[Dict]:
+    query = dict(query)
+    near = query.pop("location")["$nearSphere"]
+    geo_near = {
+        "near": near["$geometry"],
+        "distanceField": DISTANCE_FIELD,
+        # locations has more than one 2dsphere index (see migrations.create_open_interval_indexes)
+        "key": "location",
+        "maxDistance": near["$maxDistance"],
+        "query": query,
+        "spherical": True,
+    }
+    if after is not None:
+        geo_near["minDistance"] = after["distance"]
+        query["_id"] = {"$nin": after["seen"]}
+    return [{"$geoNear": geo_near}, {"$limit": limit}, {"$project": {**projection, DISTANCE_FIELD: 1}}]
+
+################
+### Sampling ###
+################
+
+# Radius of the sphere Mongo uses for $nearSphere distances
+MONGO_EARTH_RADIUS_METERS = 6378100
+
+# ``query`` with its $nearSphere clause replaced by an unordered $geoWithin of the same circle
+def within_radius_query(query: Dict) -> Dict:
+    query = dict(query)
+    near = query.pop("location")["$nearSphere"]
+    center = near["$geometry"]["coordinates"]
+    query["location"] = {"$geoWithin": {"$centerSphere": [center, near["$maxDistance"] / MONGO_EARTH_RADIUS_METERS]}}
+    return query
+
+# Uniform random page of the whole radius, drawn by Mongo
+def nearby_sample_pipeline(query: Dict, limit: int, projection: Dict) -> List[Dict]:
+    return [{"$match": within_radius_query(query)}, {"$sample": {"size": limit}}, {"$project": projection}]
+
+# Stable pseudo-random position of a document for ``seed``; ordering by it gives a seeded shuffle
+def sample_priority(seed: int, document_id) -> int:
+    digest = hashlib.blake2b(f"{seed}:{document_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+#######################
+### Tile candidates ###
+#######################
+
+# Distance on the sphere Mongo measures $geoNear distances on
+def great_circle_meters(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi, d_lambda = phi2 - phi1, math.radians(longitude2 - longitude1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * MONGO_EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+# Farthest any point of the ``bounds`` box (see cache.geohash_bounds) is from the point inside it
+def box_reach(latitude: float, longitude: float, bounds) -> float:
+    (south, north), (west, east) = bounds
+    return max(great_circle_meters(latitude, longitude, corner_latitude, corner_longitude)
+               for corner_latitude in (south, north) for corner_longitude in (west, east))
+
+# Candidates to fetch for a tile so that a caller's page of ``limit`` is rarely left short: the widened circle
+# holds ((radius + reach) / radius)^2 times the caller's share, and a distance page is only settled by the
+# candidates twice the reach past its last location
+def tile_fetch_limit(limit: int, radius: float, reach: float, sort_by: str) -> int:
+    slack = 4 if sort_by == "distance" else 2
+    return math.ceil(slack * limit * ((radius + reach) / max(radius, 1.0)) ** 2)
+
+def nearby_page(candidates: List[Dict], latitude: float, longitude: float, radius: float, limit: int, sort_by: str,
+                exhausted: bool, after: Optional[Dict] = None, open_at: Optional[int] = None, reach: float = 0.0,
+                with_keys: bool = False):
+    """The caller's page of ``candidates`` and the cursor state following it.
+
+    ``candidates`` are the results of a query in ``sort_by`` order, run ``reach`` meters at most from
+    (latitude, longitude) over a radius widened by ``reach``, and holding ``location``; with
+    ``exhausted`` nothing matched past the last of them. They are narrowed to the caller's radius and
+    to what is open at ``open_at``, and distance pages are reordered by the caller's own distance.
+
+    Returns (page, state); state is None when nothing follows. With a ``reach``, the page is None
+    when the candidates cannot fill it, and the caller's own position has to be queried.
+    """
+    entries = []
+    for candidate in candidates:
+        if reach:
+            candidate_longitude, candidate_latitude = candidate["location"]["coordinates"]
+            distance = great_circle_meters(latitude, longitude, candidate_latitude, candidate_longitude)
+            if distance > radius:
+                continue
+        else:
+            distance = candidate.get(DISTANCE_FIELD)
+        if open_at is not None and not is_open_at(candidate.get("open_intervals"), open_at):
+            continue
+        if sort_by == "distance" and after is not None and distance < after["distance"]:
+            continue
+        entries.append((distance, candidate))
+
+    boundary = None
+    if sort_by == "distance":
+        entries.sort(key=lambda entry: entry[0])
+        if not exhausted and candidates:
+            # A location past the last candidate is at least this far from the caller
+            boundary = candidates[-1][DISTANCE_FIELD] - reach
+            entries = [entry for entry in entries if entry[0] <= boundary]
+
+    # Candidates may be shared through the cache, so the page is made of copies
+    page = []
+    for distance, candidate in entries[:limit]:
+        item = {key: value for key, value in candidate.items() if key != DISTANCE_FIELD}
+        if with_keys and sort_by == "distance":
+            item[DISTANCE_FIELD] = distance
+        page.append(item)
+
+    if reach and not exhausted and len(page) < limit:
+        return None, None
+    if not with_keys:
+        return page, None
+    if limit > 0 and len(page) == limit:
+        return page, page_state(page, sort_by, after)
+    if exhausted or not candidates:
+        return page, None
+    if sort_by != "distance":
+        # Nothing between the page and the last candidate is open: resume after it
+        return page, page_state([candidates[-1]], sort_by, after)
+    state = {"id": candidates[-1]["_id"], "distance": boundary,
+             "seen": [candidate["_id"] for candidate in candidates if candidate[DISTANCE_FIELD] == boundary]}
+    if after is not None and after["distance"] == boundary:
+        state["seen"] += after["seen"]
+    return page, state
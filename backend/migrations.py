@@ -0,0 +1,85 @@
+"""Backfills for derived location fields and the indexes that serve them.
+
+Usage (from backend/):
+    python migrations.py open_intervals --mongo-url mongodb://localhost:27017/
+    python migrations.py category_keys --mongo-url mongodb://localhost:27017/
+"""
+import argparse
+import time
+
+import pymongo
+from pymongo import UpdateOne
+
+from config import Settings
+from utils import hours_to_open_intervals, normalize_categories
+
+SETTINGS = Settings.from_env()
+DEFAULT_MONGO_URL = SETTINGS.mongo_url
+DATABASE_NAME = SETTINGS.mongo_database
+LOCATION_COLLECTIONS = ["locations", "locationsv2"]
+
+def backfill(collection, derive, projection, batch_size=1000):
+    """Set the fields returned by ``derive(document)`` on every document."""
+    operations = []
+    updated = 0
+    for document in collection.find({}, projection):
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": derive(document)}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+######################
+### Open intervals ###
+######################
+
+def derive_open_intervals(document):
+    return {"open_intervals": hours_to_open_intervals(document.get("hours"))}
+
+def create_open_interval_indexes(collection):
+    collection.create_index([("location", pymongo.GEOSPHERE),
+                             ("cur_open", pymongo.ASCENDING),
+                             ("open_intervals.start", pymongo.ASCENDING),
+                             ("open_intervals.end", pymongo.ASCENDING)],
+                            name="location_open_intervals")
+
+def migrate_open_intervals(db):
+    for name in LOCATION_COLLECTIONS:
+        start = time.time()
+        updated = backfill(db[name], derive_open_intervals, {"hours": 1})
+        create_open_interval_indexes(db[name])
+        print(f"{name}: open_intervals set on {updated} documents in {time.time() - start:.1f}s")
+
+#####################
+### Category keys ###
+#####################
+
+def derive_category_keys(document):
+    return {"category_keys": normalize_categories(document.get("categories"))}
+
+def create_category_indexes(collection):
+    # category_keys and tag are both arrays, which a single compound index cannot hold
+    collection.create_index([("location", pymongo.GEOSPHERE), ("category_keys", pymongo.ASCENDING)],
+                            name="location_category_keys")
+    collection.create_index([("location", pymongo.GEOSPHERE), ("tag", pymongo.ASCENDING)],
+                            name="location_tag")
+
+def migrate_category_keys(db):
+    start = time.time()
+    updated = backfill(db["locations"], derive_category_keys, {"categories": 1})
+    create_category_indexes(db["locations"])
+    print(f"locations: category_keys set on {updated} documents in {time.time() - start:.1f}s")
+
+MIGRATIONS = {
+    "open_intervals": migrate_open_intervals,
+    "category_keys": migrate_category_keys,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    parser.add_argument("--mongo-url", default=DEFAULT_MONGO_URL)
+    args = parser.parse_args()
+    MIGRATIONS[args.migration](pymongo.MongoClient(args.mongo_url)[DATABASE_NAME])
@@ -1,12 +1,22 @@
-from typing import List, Optional, Dict
-from rapidfuzz import process, fuzz
+from typing import List, Optional, Dict, Sequence, Tuple
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 import uuid
 from enum import Enum
-from pymongo.collection import Collection
 import pytz
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 
+from motor.motor_asyncio import AsyncIOMotorCollection
+from redis.asyncio import Redis
+from cache import IntentCache
+from location_index import LocationNameIndex
+from vocabulary import aget_tag_vocabulary
+from utils import is_open_now, minute_of_week, open_at_query
+from ranking import extract_keywords, rank_candidates
+from telemetry import span, traced
 from pydantic.v1 import Field, validator
 from langchain.pydantic_v1 import BaseModel
 from langchain.tools import StructuredTool
@@ -14,10 +24,14 @@ from langchain_mistralai import ChatMistralAI
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts.chat import MessagesPlaceholder, HumanMessagePromptTemplate, PromptTemplate
-from langchain_community.chat_message_histories import RedisChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.output_parsers import CommaSeparatedListOutputParser
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage, message_to_dict, messages_from_dict
+
+logger = logging.getLogger(__name__)
+
+MISTRAL_ENDPOINT = "https://api.mistral.ai/v1"
 
 ##############
 ### Models ###
@@ -92,27 +106,158 @@ class NearbyLocationInput(BaseModel):
             return "llmsort"
         return v
 
+####################
+### Chat context ###
+####################
+
+# Tag on the sort chain, so streamed agent events can leave out its tokens
+SORT_MODEL_TAG = "sort_model"
+
+@dataclass
+class ChatContext:
+    latitude: float
+    longitude: float
+    session_id: str
+    message: str = ""
+    # "local" ranks llmsort candidates with ranking.rank_candidates, "llm" asks the sort model
+    ranker: str = "llm"
+    preference_tags: List[str] = field(default_factory=list)
+    # History loaded once for the turn; shared by the agent and the sort model
+    session: Optional["ChatSession"] = None
+    # Full documents of the last recommendation, returned as the turn's location cards
+    locations: Optional[List[Dict]] = None
+
+# Per-request values read by the tools of the shared agent
+chat_context: ContextVar[ChatContext] = ContextVar("chat_context")
+
+@contextmanager
+def use_chat_context(latitude: float, longitude: float, session_id: str, message: str = "",
+                     ranker: str = "llm", preference_tags: Optional[List[str]] = None,
+                     session: Optional["ChatSession"] = None):
+    context = ChatContext(latitude=latitude, longitude=longitude, session_id=session_id, message=message,
+                          ranker=ranker, preference_tags=preference_tags or [], session=session)
+    token = chat_context.set(context)
+    try:
+        yield context
+    finally:
+        chat_context.reset(token)
+
 ##########################
 ### Session management ###
 ##########################
 
-def get_session_history(session_id: str, redis_url: str, key_prefix: str = "chat_history") -> RedisChatMessageHistory:
-    memory = RedisChatMessageHistory(session_id, redis_url, key_prefix=key_prefix, ttl=3600)
-    return memory
-
-def delete_session_id(session_id: str, redis_url: str, key_prefix: str = "chat_history") -> None:
-    memory = RedisChatMessageHistory(session_id, redis_url, key_prefix=key_prefix, ttl=3600)
-    memory.clear()
-
-def add_message_to_session_id(message: str, session_id: str, redis_url: str, key_prefix: str = "chat_history") -> None:
-    memory = RedisChatMessageHistory(session_id, redis_url, key_prefix=key_prefix, ttl=3600)
-    memory.add_message(HumanMessage(message))
+class ChatSession(BaseChatMessageHistory):
+    """Chat history of one session for the duration of one turn.
+
+    ``load`` reads the history in one round trip. Messages added during the
+    turn are buffered and written by ``flush`` in one pipelined round trip.
+    Both the sync and async hooks are implemented: the pinned langchain-core
+    0.2.0 reads history through ``aget_messages`` but saves the exchange
+    through the sync ``add_messages``. Keys and
+    message encoding match langchain's RedisChatMessageHistory.
+    """
+
+    def __init__(self, session_id: str, redis_client: Redis, key_prefix: str = "chat_history", ttl: Optional[int] = 3600):
+        self.session_id = session_id
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.loaded = False
+        self.round_trips = 0
+        self._messages: List[BaseMessage] = []
+        self._pending: List[BaseMessage] = []
+        self._cleared = False
+
+    @property
+    def key(self) -> str:
+        return self.key_prefix + self.session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return list(self._messages)
+
+    async def load(self) -> List[BaseMessage]:
+        items = await self.redis_client.lrange(self.key, 0, -1)
+        self.round_trips += 1
+        self._messages = messages_from_dict([json.loads(item.decode("utf-8")) for item in items[::-1]]) + self._pending
+        self.loaded = True
+        return self.messages
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        if not self.loaded:
+            return await self.load()
+        return self.messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._messages.extend(messages)
+        self._pending.extend(messages)
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.add_messages(messages)
+
+    def clear(self) -> None:
+        self._messages = []
+        self._pending = []
+        self._cleared = True
+
+    async def aclear(self) -> None:
+        self.clear()
+
+    async def flush(self) -> None:
+        if not self._pending and not self._cleared:
+            return
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            if self._cleared:
+                pipe.delete(self.key)
+            if self._pending:
+                # Newest first, as RedisChatMessageHistory stores them
+                pipe.lpush(self.key, *[json.dumps(message_to_dict(message)) for message in self._pending])
+                if self.ttl:
+                    pipe.expire(self.key, self.ttl)
+            await pipe.execute()
+        self.round_trips += 1
+        self._pending = []
+        self._cleared = False
+
+class SessionStore:
+    """Opens and saves chat sessions on the shared Redis client and counts the
+    round trips each turn costs (one read on open, one pipelined write on save)."""
+
+    def __init__(self, redis_client: Redis, key_prefix: str = "chat_history", ttl: Optional[int] = 3600):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.counters = {"turns": 0, "round_trips": 0, "max_round_trips": 0}
+
+    async def open(self, session_id: str) -> ChatSession:
+        session = ChatSession(session_id, self.redis_client, key_prefix=self.key_prefix, ttl=self.ttl)
+        await session.load()
+        return session
+
+    async def save(self, session: ChatSession) -> int:
+        await session.flush()
+        self.counters["turns"] += 1
+        self.counters["round_trips"] += session.round_trips
+        self.counters["max_round_trips"] = max(self.counters["max_round_trips"], session.round_trips)
+        return session.round_trips
+
+    def stats(self) -> Dict[str, float]:
+        turns = self.counters["turns"]
+        return {**self.counters, "round_trips_per_turn": self.counters["round_trips"] / turns if turns else 0.0}
+
+async def delete_session_id(session_id: str, redis_client: Redis, key_prefix: str = "chat_history") -> None:
+    await redis_client.delete(key_prefix + session_id)
+
+async def add_message_to_session_id(message: str, session_id: str, redis_client: Redis, key_prefix: str = "chat_history") -> None:
+    session = ChatSession(session_id, redis_client, key_prefix=key_prefix, ttl=3600)
+    session.add_messages([HumanMessage(message)])
+    await session.flush()
 
 def generate_session_id() -> str:
     return str(uuid.uuid4())
 
-def get_session_ids(redis_client, key_prefix: str = "chat_history") -> List[str]:
-    keys = redis_client.keys(f"{key_prefix}*")
+async def get_session_ids(redis_client: Redis, key_prefix: str = "chat_history") -> List[str]:
+    keys = await redis_client.keys(f"{key_prefix}*")
     session_ids = []
     for key in keys:
         decoded_key = key.decode("utf-8")
@@ -121,95 +266,76 @@ def get_session_ids(redis_client, key_prefix: str = "chat_history") -> List[str]
             session_ids.append(session_id)
     return session_ids
 
-def get_session_messages(session_id: str, redis_url: str, key_prefix: str = "chat_history"):
-    memory = RedisChatMessageHistory(session_id, redis_url, key_prefix=key_prefix, ttl=3600)
-    return memory.messages
+async def get_session_messages(session_id: str, redis_client: Redis, key_prefix: str = "chat_history") -> List[BaseMessage]:
+    session = ChatSession(session_id, redis_client, key_prefix=key_prefix, ttl=3600)
+    return await session.load()
 
 ########################
 ### Helper functions ###
 ########################
 
-def search_tag_by_name(tag_names: List[str], collection: Collection) -> List[str]:
-    # Retrieve all tags from the collection
-    tags = collection.distinct("tags")
-    
-    matched_tags = []
-    for tag_name in tag_names:
-        best_match = process.extractOne(tag_name, tags, scorer=fuzz.ratio)
-        if best_match:
-            matched_tags.append(best_match[0])
-    
-    return matched_tags
-
-def search_location_by_name(business_name: str, collection: Collection) -> Optional[Dict]:
-    # Retrieve all business names from the collection
-    businesses = collection.find({}, {"name": 1})
-    business_names = [business["name"] for business in businesses]
-
-    # Find the best match for the given business name
-    best_match = process.extractOne(business_name, business_names, scorer=fuzz.ratio)
-    
-    if best_match:
-        matched_name = best_match[0]
-        # Retrieve the corresponding document from the collection
-        matched_business = collection.find_one(
-            {"name": matched_name},
-            {
-                "_id": 0,
-                "business_id": 1,
-                "name": 1,
-                "image_url": 1,
-                "address": 1,
-                "stars": 1,
-                "review_count": 1,
-                "cur_open": 1,
-                # "price": 1,
-                "phone": 1,
-                "display_phone": 1,
-                "summary": 1,
-                "tags": 1,
-                "hours": 1,
-                "location": 1,
-            }
-        )
-        return matched_business
-
-    return None
-
-def is_within_hours(now, hours):
-    if not hours or not isinstance(hours, list) or len(hours) != 2:
-        return False
-    open_time_str, close_time_str = hours
-    open_hour, open_minute = int(open_time_str[:2]), int(open_time_str[2:])
-    close_hour, close_minute = int(close_time_str[:2]), int(close_time_str[2:])
-
-    open_time = now.replace(hour=open_hour, minute=open_minute, second=0, microsecond=0)
-    close_time = now.replace(hour=close_hour, minute=close_minute, second=0, microsecond=0)
-
-    if close_time <= open_time:
-        close_time += timedelta(days=1)
-
-    return open_time <= now <= close_time
+async def search_tag_by_name(tag_names: List[str], collection: AsyncIOMotorCollection) -> List[str]:
+    # Resolve all requested tags in one batch against the cached vocabulary
+    vocabulary = await aget_tag_vocabulary(collection)
+    return vocabulary.match(tag_names)
+
+# Fields the sort model needs to judge a candidate
+SORT_MODEL_FIELDS = ("name", "tags", "stars", "review_count", "price", "summary")
+
+def candidate_keys(businesses: List[Dict]) -> Dict[str, Dict]:
+    # Short keys ("L1", "L2", ...) tied to this candidate list; same-named businesses stay distinct
+    return {f"L{index}": business for index, business in enumerate(businesses, start=1)}
+
+def sort_model_payload(keyed_businesses: Dict[str, Dict]) -> List[Dict]:
+    return [{"key": key, **{name: business.get(name) for name in SORT_MODEL_FIELDS}}
+            for key, business in keyed_businesses.items()]
+
+def reorder_by_keys(keyed_businesses: Dict[str, Dict], sorted_keys: List[str]) -> List[Dict]:
+    """Candidates in the order of ``sorted_keys``; unknown and repeated keys are ignored.
+    Falls back to the fetched order when the model returns no usable key."""
+    ordered = []
+    seen = set()
+    for key in sorted_keys:
+        key = key.strip().strip("'\"`[]").upper()
+        if key in keyed_businesses and key not in seen:
+            seen.add(key)
+            ordered.append(keyed_businesses[key])
+    return ordered or list(keyed_businesses.values())
+
+def search_location_by_name(business_name: str, name_index: LocationNameIndex) -> Optional[Dict]:
+    # Fuzzy match against the in-memory name index instead of scanning the collection
+    if not name_index.loaded:
+        name_index.ensure_started()
+    return name_index.search(business_name)
 
 ######################
 ### Tool functions ###
 ######################
 
-def get_location_recommendations(latitude: float,
-                                 longitude: float,
-                                 tags: Optional[List[str]],
-                                 radius: Optional[float],
-                                 limit: Optional[int],
-                                 cur_open: Optional[int],
-                                 sort_by: Optional[str],
-                                 locations_db: Collection,
-                                 session_id: str,
-                                 redis_url: str,
-                                 sort_model) -> List[Optional[str]]:
-    """Retrieve location recommendations based on user preferences."""
-    matched_tags = search_tag_by_name(tags, locations_db)
-    print(matched_tags)
-    print(latitude, longitude, tags, radius, limit, cur_open, sort_by, locations_db, session_id, cur_open)
+# Fields kept on recommendation candidates: what the rankers read and what the client's location cards show
+RECOMMENDATION_FIELDS = ("business_id", "name", "image_url", "location", "address", "stars", "review_count", "price",
+                         "phone", "display_phone", "cur_open", "summary", "tags", "hours", "open_intervals")
+
+# Candidate documents for the recommendation tool, best first
+async def fetch_ranked_businesses(latitude: float,
+                                  longitude: float,
+                                  matched_tags: List[str],
+                                  radius: Optional[float],
+                                  open_at: Optional[int],
+                                  sort_by: Optional[str],
+                                  locations_db: AsyncIOMotorCollection,
+                                  chat_history: List[BaseMessage],
+                                  sort_model,
+                                  ranker: str,
+                                  preference_tags: List[str],
+                                  message: str) -> List[Dict]:
+    geo_query = {
+        "tags": {"$in": matched_tags}
+    }
+    if open_at is not None:
+        # Filter on the precomputed weekly intervals before the $limit stage
+        geo_query["open_intervals"] = open_at_query(open_at)
+
     query_base = [
         {
             "$geoNear": {
@@ -218,10 +344,10 @@ def get_location_recommendations(latitude: float,
                     "coordinates": [longitude, latitude]
                 },
                 "distanceField": "dist.calculated",
+                # The open-interval migration adds a second 2dsphere index on location
+                "key": "location",
                 "maxDistance": radius,
-                "query": {
-                    "tags": {"$in": matched_tags}
-                },
+                "query": geo_query,
                 "spherical": True
             }
         },
@@ -243,26 +369,10 @@ def get_location_recommendations(latitude: float,
             "$limit": 15
         },
         {
-            "$project": {
-                "_id": 0,
-                "name": 1,
-                "location": 1,
-                "address": 1,
-                "stars": 1,
-                "review_count": 1,
-                "price": 1,
-                "phone": 1,
-                "summary": 1,
-                "tags": 1,
-                "hours": 1
-            }
+            "$project": {"_id": 0, **{field: 1 for field in RECOMMENDATION_FIELDS}}
         }
     ]
 
-    pacific = pytz.timezone('America/Los_Angeles')
-    now_utc = datetime.now(pytz.utc)
-    now = now_utc.astimezone(pacific)
-
     sort_criteria = {
         "matched_tags_count": -1
     }
@@ -270,30 +380,86 @@ def get_location_recommendations(latitude: float,
     if sort_by in ["stars", "review_count", "price"]:
         sort_criteria[sort_by] = -1 if sort_by != "price" else 1
         query_base.insert(-1, {"$sort": sort_criteria})
-        output_businesses_final = list(locations_db.aggregate(query_base))
+        output_businesses_final = await locations_db.aggregate(query_base).to_list(None)
 
     elif sort_by == "distance":
         sort_criteria["dist.calculated"] = 1
         query_base.insert(-1, {"$sort": sort_criteria})
-        output_businesses_final = list(locations_db.aggregate(query_base))
+        output_businesses_final = await locations_db.aggregate(query_base).to_list(None)
 
     else:
         query_base.insert(-1, {"$sort": sort_criteria})
-        output_businesses_temp = list(locations_db.aggregate(query_base))
-        sorted_business_names = []
-        if len(output_businesses_temp) > 0:
-            sorted_business_names = sort_model.invoke(
-                {
-                    "chat_history": get_session_messages(session_id, redis_url),
-                    "list_of_locations": json.dumps(output_businesses_temp),
-                    "input": get_session_messages(session_id, redis_url, key_prefix="input")[0].content,
-                }
-            )
-        output_businesses_final = []
-        for business_name in sorted_business_names:
-            true_business = search_location_by_name(business_name, locations_db)
-            if true_business is not None:
-                output_businesses_final.append(true_business)
+        output_businesses_temp = await locations_db.aggregate(query_base).to_list(None)
+        if ranker == "local":
+            # Score in process and keep the fetched documents, so nothing is re-resolved by name
+            candidates = [{
+                "name": business.get("name"),
+                "tags": business.get("tags"),
+                "stars": business.get("stars"),
+                "review_count": business.get("review_count"),
+                "latitude": business["location"]["coordinates"][1] if business.get("location") else None,
+                "longitude": business["location"]["coordinates"][0] if business.get("location") else None,
+            } for business in output_businesses_temp]
+            order = rank_candidates(candidates, preference_tags or [], extract_keywords(message), latitude, longitude)
+            output_businesses_final = [output_businesses_temp[index] for index in order]
+        elif len(output_businesses_temp) > 0:
+            # The sort model sees short keys and returns them; the order is applied to the fetched documents
+            keyed_businesses = candidate_keys(output_businesses_temp)
+            with span("sort_model"):
+                sorted_keys = await sort_model.ainvoke(
+                    {
+                        "chat_history": chat_history,
+                        "list_of_locations": json.dumps(sort_model_payload(keyed_businesses)),
+                        "input": message,
+                    }
+                )
+            output_businesses_final = reorder_by_keys(keyed_businesses, sorted_keys)
+        else:
+            output_businesses_final = []
+
+    return output_businesses_final
+
+async def get_location_recommendations(latitude: float,
+                                       longitude: float,
+                                       tags: Optional[List[str]],
+                                       radius: Optional[float],
+                                       limit: Optional[int],
+                                       cur_open: Optional[int],
+                                       sort_by: Optional[str],
+                                       locations_db: AsyncIOMotorCollection,
+                                       chat_history: List[BaseMessage],
+                                       sort_model,
+                                       ranker: str = "llm",
+                                       preference_tags: Optional[List[str]] = None,
+                                       message: str = "",
+                                       intent_cache: Optional[IntentCache] = None) -> Tuple[List[Optional[str]], List[Dict]]:
+    """Retrieve location recommendations based on user preferences.
+
+    Returns the names passed back to the agent and the full documents shown as location cards."""
+    matched_tags = await search_tag_by_name(tags, locations_db)
+    logger.debug("Recommendation tags %s matched %s (radius=%s, limit=%s, cur_open=%s, sort_by=%s)",
+                 tags, matched_tags, radius, limit, cur_open, sort_by)
+    pacific = pytz.timezone('America/Los_Angeles')
+    now_utc = datetime.now(pytz.utc)
+    now = now_utc.astimezone(pacific)
+    open_at = minute_of_week(now) if cur_open == 1 else None
+    preference_tags = preference_tags or []
+
+    # Repeat intents reuse an earlier ranking; the local ranker also depends on the user's tags and keywords
+    intent_key = None
+    output_businesses_final = None
+    if intent_cache is not None:
+        personalization = {"preferences": sorted(preference_tags), "keywords": extract_keywords(message)} if ranker == "local" else {}
+        intent_key = intent_cache.intent_key(latitude, longitude, matched_tags, radius, open_at,
+                                             sort_by=sort_by, ranker=ranker, **personalization)
+        output_businesses_final = await intent_cache.get(intent_key)
+
+    if output_businesses_final is None:
+        output_businesses_final = await fetch_ranked_businesses(latitude, longitude, matched_tags, radius, open_at, sort_by,
+                                                                locations_db, chat_history, sort_model,
+                                                                ranker, preference_tags, message)
+        if intent_key is not None and len(output_businesses_final) > 0:
+            await intent_cache.set(intent_key, output_businesses_final, ttl=intent_cache.entry_ttl(open_at))
     
     all_businesses = []
     all_businesses_full = []
@@ -301,10 +467,12 @@ def get_location_recommendations(latitude: float,
     open_businesses_full = []
     
     for business in output_businesses_final[:limit]:
-        day_of_week = now.strftime('%A')
-        hours_list = business.get('hours', {}).get(day_of_week)
+        # Copy, since cached rankings are shared between requests
+        business = dict(business)
+        is_open = is_open_now(business, now)
+        business.pop("open_intervals", None)
 
-        if is_within_hours(now, hours_list):
+        if is_open:
             open_businesses.append(business["name"])
             open_businesses_full.append(business)
 
@@ -312,15 +480,13 @@ def get_location_recommendations(latitude: float,
         all_businesses_full.append(business)
 
     if cur_open == 1:
-        add_message_to_session_id(json.dumps(open_businesses_full), session_id, redis_url, key_prefix="locations")
-        return open_businesses
+        return open_businesses, open_businesses_full
     else:
-        add_message_to_session_id(json.dumps(all_businesses_full), session_id, redis_url, key_prefix="locations")
-        return all_businesses
+        return all_businesses, all_businesses_full
 
-def get_location_general_description(business_name: str, locations_db: Collection) -> Optional[LocationInfoCondensed]:
+def get_location_general_description(business_name: str, name_index: LocationNameIndex) -> Optional[LocationInfoCondensed]:
     """Retrieve the general description of a location."""
-    business = search_location_by_name(business_name, locations_db)
+    business = search_location_by_name(business_name, name_index)
     
     if business:
         location_info = LocationInfoCondensed(
@@ -338,9 +504,9 @@ def get_location_general_description(business_name: str, locations_db: Collectio
     else:
         return None
 
-def get_location_address(business_name: str, locations_db: Collection) -> Optional[LocationInfoFunctionReturn]:
+def get_location_address(business_name: str, name_index: LocationNameIndex) -> Optional[LocationInfoFunctionReturn]:
     """Retrieve the address of a location."""
-    business = search_location_by_name(business_name, locations_db)
+    business = search_location_by_name(business_name, name_index)
     
     if business:
         location_info = LocationInfoFunctionReturn(
@@ -352,9 +518,9 @@ def get_location_address(business_name: str, locations_db: Collection) -> Option
     else:
         return None
 
-def get_location_review_summary(business_name: str, locations_db: Collection) -> Optional[LocationInfoFunctionReturn]:
+def get_location_review_summary(business_name: str, name_index: LocationNameIndex) -> Optional[LocationInfoFunctionReturn]:
     """Retrieve the summary of a location's reviews."""
-    business = search_location_by_name(business_name, locations_db)
+    business = search_location_by_name(business_name, name_index)
 
     if business:
         location_info = LocationInfoFunctionReturn(
@@ -366,9 +532,9 @@ def get_location_review_summary(business_name: str, locations_db: Collection) ->
     else:
         return None
 
-def get_location_review_count(business_name: str, locations_db: Collection) -> Optional[LocationInfoFunctionReturn]:
+def get_location_review_count(business_name: str, name_index: LocationNameIndex) -> Optional[LocationInfoFunctionReturn]:
     """Retreive the number of reviews of a location."""
-    business = search_location_by_name(business_name, locations_db)
+    business = search_location_by_name(business_name, name_index)
 
     if business:
         location_info = LocationInfoFunctionReturn(
@@ -380,9 +546,9 @@ def get_location_review_count(business_name: str, locations_db: Collection) -> O
     else:
         return None
 
-def get_location_rating_score(business_name: str, locations_db: Collection) -> Optional[LocationInfoFunctionReturn]:
+def get_location_rating_score(business_name: str, name_index: LocationNameIndex) -> Optional[LocationInfoFunctionReturn]:
     """Retrieve the star rating of a location (score is between 1 through 5)."""
-    business = search_location_by_name(business_name, locations_db)
+    business = search_location_by_name(business_name, name_index)
 
     if business:
         location_info = LocationInfoFunctionReturn(
@@ -394,9 +560,9 @@ def get_location_rating_score(business_name: str, locations_db: Collection) -> O
     else:
         return None
 
-def get_location_phone_number(business_name: str, locations_db: Collection) -> Optional[LocationInfoFunctionReturn]:
+def get_location_phone_number(business_name: str, name_index: LocationNameIndex) -> Optional[LocationInfoFunctionReturn]:
     """Retrieve the phone number of a location."""
-    business = search_location_by_name(business_name, locations_db)
+    business = search_location_by_name(business_name, name_index)
 
     if business:
         location_info = LocationInfoFunctionReturn(
@@ -408,16 +574,16 @@ def get_location_phone_number(business_name: str, locations_db: Collection) -> O
     else:
         return None
     
-def initalize_sort_model(model_name: str, api_key: str):
+def initalize_sort_model(model_name: str, api_key: str, endpoint: str = MISTRAL_ENDPOINT):
 
-    llm = ChatMistralAI(model=model_name, api_key=api_key)
+    llm = ChatMistralAI(model=model_name, api_key=api_key, endpoint=endpoint)
     parser = CommaSeparatedListOutputParser()
 
     prompt = ChatPromptTemplate.from_messages([
         ("system", """Given a chat history, a list of locations, and the latest user request \
          which might reference context in the chat history, select and sort the locations from best to worst \
-         that best match the user preferences and chat history context. Only return the list of \
-         exact names without any additional text."""),
+         that best match the user preferences and chat history context. Each location has a short key \
+         such as L1. Only return the list of keys without any additional text."""),
         MessagesPlaceholder("chat_history", optional=True),
         # ("human", "{input}")
         HumanMessagePromptTemplate(
@@ -427,32 +593,45 @@ def initalize_sort_model(model_name: str, api_key: str):
                     "\nLatest User Request: {input}\n"
                     "\nList of Locations: {list_of_locations}\n"
                     "\nFormat Instructions: {format_instructions}\n"
-                    "Select and sort the locations from best to worst based on the chat history and latest user request to best match the user preferences. Only return the list of exact business names without any additional text."
+                    "Select and sort the locations from best to worst based on the chat history and latest user request to best match the user preferences. Only return the list of location keys (for example: L3, L1, L2) without any additional text."
                 ),
                 partial_variables={"format_instructions": parser.get_format_instructions()}
             )
         )
     ])
 
-    chain = prompt | llm | parser
+    chain = (prompt | llm | parser).with_config(tags=[SORT_MODEL_TAG])
 
     return chain
 
-def initalize_chat_model(model_name: str, api_key: str, redis_url: str, locations_db: Collection, latitude: float, longitude: float, session_id: str, sort_model):
-    get_location_recommendations_tool = StructuredTool.from_function(
-        func=lambda cur_open=1, sort_by="llmsort", limit=30, radius=10000, tags=["all"]: get_location_recommendations(
-            latitude=latitude,
-            longitude=longitude,
+def initalize_chat_model(model_name: str, api_key: str, locations_db: AsyncIOMotorCollection, name_index: LocationNameIndex, sort_model,
+                         intent_cache: Optional[IntentCache] = None, endpoint: str = MISTRAL_ENDPOINT):
+    # Built once per process; the caller supplies location and the opened session through use_chat_context
+    async def location_recommendations(cur_open=1, sort_by="llmsort", limit=30, radius=10000, tags=["all"]):
+        context = chat_context.get()
+        names, businesses = await get_location_recommendations(
+            latitude=context.latitude,
+            longitude=context.longitude,
             tags=tags,
             radius=radius,
             limit=limit,
             cur_open=cur_open,
             sort_by=sort_by,
             locations_db=locations_db,
-            session_id=session_id,
-            redis_url=redis_url,
-            sort_model=sort_model
-        ),
+            chat_history=context.session.messages if context.session is not None else [],
+            sort_model=sort_model,
+            ranker=context.ranker,
+            preference_tags=context.preference_tags,
+            message=context.message,
+            intent_cache=intent_cache
+        )
+        # Kept in memory for the turn instead of a Redis "locations" key
+        context.locations = businesses
+        return names
+
+    # The recommendation tool only has a coroutine, so the agent must be driven through ainvoke
+    get_location_recommendations_tool = StructuredTool.from_function(
+        coroutine=traced("agent_tool.get_location_recommendations_tool")(location_recommendations),
         name="get_location_recommendations_tool",
         description="Retrieve location recommendations based on user preferences.",
         args_schema=NearbyLocationInput,
@@ -460,7 +639,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
     )
 
     location_general_description_tool = StructuredTool.from_function(
-        func = lambda business_name: get_location_general_description(business_name, locations_db),
+        func = traced("agent_tool.location_general_description_tool")(lambda business_name: get_location_general_description(business_name, name_index)),
         name = "location_general_description_tool",
         description = "Retrieve the general description of a location.",
         args_schema = LocationNameInput,
@@ -468,7 +647,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
     )
 
     location_address_tool = StructuredTool.from_function(
-        func = lambda business_name: get_location_address(business_name, locations_db),
+        func = traced("agent_tool.location_address_tool")(lambda business_name: get_location_address(business_name, name_index)),
         name = "location_address_tool",
         description = "Retrieve the address of a location.",
         args_schema = LocationNameInput,
@@ -476,7 +655,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
     )
 
     location_review_summary_tool = StructuredTool.from_function(
-        func = lambda business_name: get_location_review_summary(business_name, locations_db),
+        func = traced("agent_tool.location_review_summary_tool")(lambda business_name: get_location_review_summary(business_name, name_index)),
         name = "location_review_summary_tool",
         description = "Retrieve the summary of a location's reviews.",
         args_schema = LocationNameInput,
@@ -484,7 +663,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
     )
 
     location_review_count_tool = StructuredTool.from_function(
-        func = lambda business_name: get_location_review_count(business_name, locations_db),
+        func = traced("agent_tool.location_review_count_tool")(lambda business_name: get_location_review_count(business_name, name_index)),
         name = "location_review_count_tool",
         description = "Retreive the number of reviews of a location.",
         args_schema = LocationNameInput,
@@ -492,7 +671,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
     )
 
     location_rating_score_tool = StructuredTool.from_function(
-        func = lambda business_name: get_location_rating_score(business_name, locations_db),
+        func = traced("agent_tool.location_rating_score_tool")(lambda business_name: get_location_rating_score(business_name, name_index)),
         name = "location_rating_score_tool",
         description = "Retrieve the star rating of a location (score is between 1 through 5).",
         args_schema = LocationNameInput,
@@ -500,7 +679,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
     )
 
     location_phone_number_tool = StructuredTool.from_function(
-        func = lambda business_name: get_location_phone_number(business_name, locations_db),
+        func = traced("agent_tool.location_phone_number_tool")(lambda business_name: get_location_phone_number(business_name, name_index)),
         name = "location_phone_number_tool",
         description = "Retrieve the phone number of a location.",
         args_schema = LocationNameInput,
@@ -515,7 +694,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
              location_rating_score_tool,
              location_phone_number_tool]
 
-    llm = ChatMistralAI(model=model_name, api_key=api_key)
+    llm = ChatMistralAI(model=model_name, api_key=api_key, endpoint=endpoint)
 
     instructions = (
         "As a location recommender for the WhatNext? app, your primary role is to provide personalized recommendations for places to visit, dine, or activities to enjoy based on user preferences using your avaliable functions. Respond in a friendly and concise manner like a real person. The responses must be short and concise to mimic standard text messages.\n\n"
@@ -554,7 +733,7 @@ def initalize_chat_model(model_name: str, api_key: str, redis_url: str, location
     
     agent_with_message_history = RunnableWithMessageHistory(
         agent_executor,
-        get_session_history = lambda session_id: get_session_history(session_id, redis_url),
+        get_session_history = lambda session_id: chat_context.get().session,
         input_messages_key="input",
         history_messages_key="chat_history"
     )
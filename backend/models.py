@@ -0,0 +1,93 @@
+from functools import lru_cache
+from typing import List, Literal, Optional, Dict
+from pydantic import BaseModel, Field
+
+class ChatRequest(BaseModel):
+    user_id: str
+    session_id: Optional[str] = Field(None, description="The session ID for the chat session, if available.")
+    message: str
+    latitude: float = Field(..., description="Latitude for the location-based query.")
+    longitude: float = Field(..., description="Longitude for the location-based query.")
+    ranker: Literal["local", "llm"] = Field("local", description="How recommended locations are ordered: scored locally (default) or by a second LLM call.")
+
+class GeoJSON(BaseModel):
+    type: str
+    coordinates: List[float]
+
+class Location(BaseModel):
+    business_id: str
+    name: Optional[str] = None
+    image_url: Optional[str] = None
+    phone: Optional[str] = None
+    display_phone: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    postal_code: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    stars: Optional[float] = None
+    review_count: Optional[int] = 0
+    cur_open: Optional[int] = 0
+    categories: Optional[List[str]] = None
+    tag: Optional[List[str]] = None
+    hours: Optional[Dict[str, List[str]]] = None
+    location: GeoJSON
+    price: Optional[str] = None
+
+class LocationCondensed(BaseModel):
+    business_id: str
+    name: Optional[str] = None
+    stars: Optional[float] = None
+    review_count: Optional[float] = None
+    cur_open: Optional[int] = 0
+    categories: Optional[List[str]] = None
+    tag: Optional[List[str]] = None
+    price: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    # Kept so cached chat rankings can recheck open status; left out of the sort prompt
+    open_intervals: Optional[List[Dict[str, int]]] = Field(None, repr=False)
+
+class ProfileRequest(BaseModel):
+    user_id: str
+
+PROFILE_BUNDLE_FIELDS = ["user_info", "friends_info", "visited_locations", "favorites_locations"]
+
+class ProfileBundleRequest(BaseModel):
+    user_id: str
+    fields: List[str] = Field(default_factory=lambda: list(PROFILE_BUNDLE_FIELDS),
+                              description="Sections to include: user_info, friends_info, visited_locations, favorites_locations.")
+
+class TagsRequest(BaseModel):
+    user_id:str
+    activities_tag: Optional[List[str]]
+    food_and_drinks_tag: Optional[List[str]]
+    tags: Optional[List[str]]
+
+class VisitedUpdateRequest(BaseModel):
+    user_id:str
+    visited:Optional[List[str]]
+
+class FavoriteUpdateRequest(BaseModel):
+    user_id:str
+    favorites:Optional[List[str]]
+
+##########################
+### Fast serialization ###
+##########################
+
+@lru_cache(maxsize=None)
+def _field_defaults(model):
+    return tuple((name, None if field.is_required() else field.default) for name, field in model.model_fields.items())
+
+# Plain dict with exactly the fields of ``model`` (defaults filled in), for direct orjson encoding
+def to_document(model, item):
+    return {name: item.get(name, default) for name, default in _field_defaults(model)}
+
+# Location built from a trusted Mongo document without running validation
+def construct_location(item):
+    location = item.get("location")
+    if isinstance(location, dict):
+        item = {**item, "location": GeoJSON.model_construct(**location)}
+    return Location.model_construct(**item)
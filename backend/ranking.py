@@ -0,0 +1,129 @@
+"""Local ranking of recommendation candidates.
+
+Both chat paths used a second LLM call only to reorder the candidates they
+had already fetched. ``rank_candidates`` scores them here instead, from tag
+overlap with the user's profile tags, keywords of the conversation, stars,
+review count and distance, with every feature computed as a NumPy vector.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+EARTH_RADIUS_METERS = 6371008.8
+
+@dataclass(frozen=True)
+class RankingWeights:
+    preference: float = 3.0
+    keywords: float = 2.0
+    stars: float = 1.0
+    reviews: float = 1.0
+    distance: float = 1.0
+
+DEFAULT_WEIGHTS = RankingWeights()
+
+STOPWORDS = frozenset("""
+    a about actually after again all also am an and any anything are around as at be been best can could do does
+    find for from get give go going good got have help how i i'd i'll i'm im in is it it's just know like looking
+    me more most much my near nearby need of on one or place places please recommend recommendation
+    recommendations right show so some somewhere something spot spots suggest suggestion suggestions that the
+    there thing things this to today tonight try u user want wanna what where which with would you your
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def extract_keywords(*texts: Optional[str]) -> List[str]:
+    """Lowercased content words of ``texts``, in order and without duplicates."""
+    keywords = {}
+    for text in texts:
+        for word in _WORD.findall((text or "").lower()):
+            if len(word) > 2 and word not in STOPWORDS:
+                keywords[word] = None
+    return list(keywords)
+
+def candidate_terms(values: Iterable[Optional[str]]) -> set:
+    # "breakfast_brunch" and "Coffee & Tea" match on their parts as well as the whole value
+    terms = set()
+    for value in values:
+        if not value:
+            continue
+        value = value.lower()
+        terms.add(value)
+        terms.update(_WORD.findall(value))
+    return terms
+
+def haversine_meters(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(a))
+
+def _column(candidates: Sequence[Dict], key: str) -> np.ndarray:
+    return np.array([candidate.get(key) if candidate.get(key) is not None else np.nan for candidate in candidates],
+                    dtype=float)
+
+def _term_matrix(term_sets: List[set], terms: Dict[str, int]) -> np.ndarray:
+    matrix = np.zeros((len(term_sets), len(terms)), dtype=np.float32)
+    rows, cols = [], []
+    for row, term_set in enumerate(term_sets):
+        for term in term_set:
+            col = terms.get(term)
+            if col is not None:
+                rows.append(row)
+                cols.append(col)
+    matrix[np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)] = 1.0
+    return matrix
+
+def _indicator(selected: Iterable[str], terms: Dict[str, int]) -> np.ndarray:
+    vector = np.zeros(len(terms), dtype=np.float32)
+    vector[np.array([terms[term] for term in selected], dtype=np.intp)] = 1.0
+    return vector
+
+def score_candidates(candidates: Sequence[Dict],
+                     preference_tags: Iterable[str],
+                     keywords: Iterable[str],
+                     latitude: Optional[float] = None,
+                     longitude: Optional[float] = None,
+                     weights: RankingWeights = DEFAULT_WEIGHTS) -> np.ndarray:
+    """Score candidates given as dicts with ``name``, ``tags``, ``stars``,
+    ``review_count``, ``latitude`` and ``longitude``; higher is better."""
+    preference = candidate_terms(preference_tags)
+    keywords = set(keywords)
+    terms = {term: index for index, term in enumerate(preference | keywords)}
+    candidate_term_sets = [candidate_terms([*(candidate.get("tags") or []), candidate.get("name")])
+                           for candidate in candidates]
+    matrix = _term_matrix(candidate_term_sets, terms)
+
+    # Share of the user's tags and of the conversation keywords each candidate covers
+    preference_score = matrix @ _indicator(preference, terms) / max(len(preference), 1)
+    keyword_score = matrix @ _indicator(keywords, terms) / max(len(keywords), 1)
+
+    stars_score = np.nan_to_num(_column(candidates, "stars") / 5.0)
+    reviews = np.log1p(np.nan_to_num(_column(candidates, "review_count")).clip(min=0))
+    reviews_score = reviews / reviews.max() if len(reviews) and reviews.max() > 0 else reviews
+
+    distance_score = np.zeros(len(candidates))
+    if latitude is not None and longitude is not None and len(candidates):
+        distances = haversine_meters(latitude, longitude, _column(candidates, "latitude"), _column(candidates, "longitude"))
+        farthest = np.nanmax(distances) if not np.all(np.isnan(distances)) else 0.0
+        if farthest > 0:
+            distance_score = np.nan_to_num(1.0 - distances / farthest)
+
+    return (weights.preference * preference_score
+            + weights.keywords * keyword_score
+            + weights.stars * stars_score
+            + weights.reviews * reviews_score
+            + weights.distance * distance_score)
+
+def rank_candidates(candidates: Sequence[Dict],
+                    preference_tags: Iterable[str],
+                    keywords: Iterable[str],
+                    latitude: Optional[float] = None,
+                    longitude: Optional[float] = None,
+                    weights: RankingWeights = DEFAULT_WEIGHTS) -> List[int]:
+    """Indices of ``candidates`` from best to worst; ties keep their fetched order."""
+    if not candidates:
+        return []
+    scores = score_candidates(candidates, preference_tags, keywords, latitude, longitude, weights)
+    return np.argsort(-scores, kind="stable").tolist()
@@ -0,0 +1,43 @@
+"""Server-sent events for the chat endpoints.
+
+A chat turn is an async generator of ``(event, data)`` pairs:
+
+- ``session``: ``{"session_id": ...}``, sent first so the client can keep the session
+- ``token``: ``{"content": ...}``, a piece of the assistant's text as it is generated
+- ``searching``: ``{"tool": ..., "arguments": ...}``, a tool call has started
+- ``response``: the same body the non-streaming endpoint returns, always last
+
+The streaming endpoints forward every event; the regular endpoints return
+the data of the ``response`` event, so both run the same code.
+"""
+from typing import Any, AsyncIterator, Tuple
+
+import orjson
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+ChatEvents = AsyncIterator[Tuple[str, Any]]
+
+def _encode_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def encode_event(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + orjson.dumps(data, default=_encode_default) + b"\n\n"
+
+async def final_response(events: ChatEvents) -> Any:
+    response = None
+    async for event, data in events:
+        if event == "response":
+            response = data
+    return response
+
+def event_stream_response(events: ChatEvents) -> StreamingResponse:
+    async def body():
+        async for event, data in events:
+            yield encode_event(event, data)
+
+    # No-transform and X-Accel-Buffering keep proxies (nginx) from holding back events
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
@@ -0,0 +1,115 @@
+"""Per-stage latency spans, Prometheus metrics and JSON logs.
+
+``span("stage")`` times a block and records it in the
+``whatnext_stage_seconds`` histogram, which is exposed on ``/metrics``.
+Finished spans are also logged at DEBUG with their request trace id, parent
+span and attributes, so ``LOG_LEVEL=DEBUG LOG_FORMAT=json`` gives a
+structured trace of every turn.
+"""
+import functools
+import inspect
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import orjson
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# LLM runs take seconds; Mongo and Redis stages take milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+STAGE_SECONDS = Histogram("whatnext_stage_seconds", "Duration of one stage of a request",
+                          ["stage", "status"], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram("whatnext_request_seconds", "Duration of HTTP requests",
+                            ["method", "route", "status_code"], buckets=LATENCY_BUCKETS)
+CHAT_OUTCOMES = Counter("whatnext_chat_turns_total", "Finished chat turns by endpoint and outcome",
+                        ["endpoint", "outcome"])
+
+trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time the enclosed block as ``stage``; exceptions are recorded and re-raised."""
+    token = current_span.set(stage)
+    parent = token.old_value if token.old_value is not token.MISSING else None
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        try:
+            current_span.reset(token)
+        except ValueError:
+            # A span around a yield in an async generator can be closed from another context
+            pass
+        STAGE_SECONDS.labels(stage=stage, status=status).observe(duration)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s took %.1f ms", stage, duration * 1e3,
+                         extra={"span": stage, "parent_span": parent, "status": status,
+                                "duration_ms": round(duration * 1e3, 3), "attributes": attributes})
+
+def traced(stage: str):
+    """Decorator form of ``span`` for sync and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def metrics_payload():
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+###############
+### Logging ###
+###############
+
+# Fields passed through ``extra`` that belong in the JSON record
+SPAN_FIELDS = ("span", "parent_span", "status", "duration_ms", "attributes")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": trace_id.get(),
+        }
+        for field in SPAN_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode("utf-8")
+
+def configure_logging(level: str = "INFO", log_format: str = "text") -> None:
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
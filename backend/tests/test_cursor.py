@@ -0,0 +1,37 @@
+import pytest
+from bson import ObjectId
+
+from location_queries import decode_cursor, encode_cursor
+
+DOCUMENT_ID = ObjectId()
+
+@pytest.mark.parametrize("state,sort_by", [
+    ({"scope": "s", "id": DOCUMENT_ID, "distance": 12.5, "seen": [DOCUMENT_ID]}, "distance"),
+    ({"scope": "s", "id": DOCUMENT_ID, "key": 123}, "random"),
+    ({"scope": "s", "id": DOCUMENT_ID, "key": 4.5}, "stars"),
+    ({"scope": "s", "id": DOCUMENT_ID, "key": None}, "review_count"),
+])
+def test_decode_round_trip(state, sort_by):
+    assert decode_cursor(encode_cursor(state), sort_by) == state
+
+@pytest.mark.parametrize("state,sort_by", [
+    ({"scope": "s", "id": DOCUMENT_ID}, "distance"),
+    ({"scope": "s", "id": DOCUMENT_ID, "distance": 12.5, "seen": "x"}, "distance"),
+    ({"scope": "s", "id": DOCUMENT_ID, "distance": 12.5, "seen": [{"$ne": None}]}, "distance"),
+    ({"scope": "s", "id": DOCUMENT_ID, "distance": "12", "seen": []}, "distance"),
+    ({"scope": "s", "id": DOCUMENT_ID, "key": 0.5}, "random"),
+    ({"scope": "s", "id": DOCUMENT_ID}, "stars"),
+    ({"scope": "s", "id": DOCUMENT_ID, "key": {"$gt": 0}}, "stars"),
+    ({"scope": "s", "id": DOCUMENT_ID, "key": [1]}, "stars"),
+    ({"scope": "s", "id": {"$gt": ""}, "key": 1}, "stars"),
+    ({"id": DOCUMENT_ID, "key": 1}, "stars"),
+    (["s", 1], "stars"),
+])
+def test_forged_cursor_is_rejected(state, sort_by):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(state), sort_by)
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "é"])
+def test_garbage_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "stars")
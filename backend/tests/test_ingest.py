@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+from ingest import category_tags, location_document, read_csv
+from vocabulary import TAGS_FILE_PATH, open_json_file
+
+TAGS = set(open_json_file(TAGS_FILE_PATH))
+
+# Category strings as they appear in the Yelp open dataset
+YELP_CATEGORIES = [
+    ("Coffee & Tea, Breakfast & Brunch, Sushi Bars, Museums", ["coffee", "breakfast_brunch", "sushi"]),
+    ("Juice Bars & Smoothies, Ice Cream & Frozen Yogurt, Hot Dogs", ["juicebars", "icecream", "hotdogs"]),
+    ("Restaurants, American (New), Wine Bars, Gluten-Free", ["restaurants", "newamerican", "wine_bars", "gluten_free"]),
+    ("Pizza, Bakeries, Chicken Wings, Steakhouses, Barbeque", ["pizza", "bakeries", "chicken_wings", "steak", "bbq"]),
+    ("Beauty & Spas, Nail Salons", ["beautysvc"]),
+]
+
+@pytest.mark.parametrize("categories,expected", YELP_CATEGORIES)
+def test_category_titles_become_vocabulary_tags(categories, expected):
+    tags = category_tags(categories)
+    assert tags == expected
+    assert set(tags) <= TAGS
+
+def test_category_aliases_are_used_when_present():
+    categories = [{"alias": "coffee", "title": "Coffee & Tea"}, {"alias": "breakfast_brunch", "title": "Breakfast & Brunch"}]
+    assert category_tags(categories) == ["coffee", "breakfast_brunch"]
+
+def test_document_tags_and_categories_from_yelp_record():
+    document = location_document({"business_id": "b1", "name": "Joe's", "latitude": "32.87", "longitude": "-117.21",
+                                  "categories": "Coffee & Tea, Museums"})
+    assert document["tag"] == ["coffee"]
+    assert document["categories"] == ["Coffee & Tea, Museums"]
+
+def test_csv_keeps_bracketed_text():
+    rows = io.StringIO('business_id,name,hours\nb1,[Closed] Joe\'s,"{""Monday"": ""8:0-17:0""}"\n'
+                       'b2,{Pop-up},[not json\n')
+    records = list(read_csv(rows))
+    assert records[0]["name"] == "[Closed] Joe's"
+    assert records[0]["hours"] == {"Monday": "8:0-17:0"}
+    assert records[1]["name"] == "{Pop-up}"
+    assert records[1]["hours"] == "[not json"
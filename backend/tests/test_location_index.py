@@ -0,0 +1,94 @@
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import location_index
+from location_index import LocationNameIndex
+
+class FakeStream:
+    def __init__(self, index, changes):
+        self.index = index
+        self.changes = list(changes)
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def try_next(self):
+        if not self.changes:
+            self.index.stop()
+            return None
+        change = self.changes.pop(0)
+        if isinstance(change, Exception):
+            raise change
+        self.resume_token = {"_data": change["documentKey"]["_id"]}
+        return change
+
+class FakeCollection:
+    """Opens one scripted stream (or raises) per watch() call."""
+    full_name = "test.locations"
+    name = "locations"
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self.resume_after = []
+        self.index = None
+
+    def watch(self, full_document=None, resume_after=None):
+        self.resume_after.append(resume_after)
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        return FakeStream(self.index, stream)
+
+    def find(self, query, projection):
+        return FakeCursor()
+
+class FakeCursor:
+    def sort(self, *args):
+        return []
+
+def update(document_id, name):
+    return {"operationType": "update", "documentKey": {"_id": document_id},
+            "fullDocument": {"_id": document_id, "name": name}}
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(location_index, "CHANGE_STREAM_RETRY_MIN", 0.0)
+
+def run(streams):
+    collection = FakeCollection(streams)
+    index = LocationNameIndex(collection)
+    collection.index = index
+    index._loaded = True
+    index._run()
+    return index, collection
+
+def test_transient_error_resumes_the_stream():
+    index, collection = run([[update(1, "Cafe"), AutoReconnect("primary stepped down")], [update(2, "Bakery")]])
+    assert index.use_change_stream
+    assert collection.resume_after == [None, {"_data": 1}]
+    assert index.search("Bakery")["name"] == "Bakery"
+
+def test_unsupported_change_streams_fall_back_to_polling():
+    collection = FakeCollection([OperationFailure("only supported on replica sets", code=40573)])
+    index = LocationNameIndex(collection, refresh_interval=0)
+    collection.index = index
+    index._loaded = True
+    index.refresh_delta = index.stop
+    index._run()
+    assert not index.use_change_stream
+
+def test_lost_history_reloads_the_index(monkeypatch):
+    loads = []
+    collection = FakeCollection([[update(1, "Cafe"), OperationFailure("history lost", code=286)], []])
+    index = LocationNameIndex(collection)
+    collection.index = index
+    index._loaded = True
+    monkeypatch.setattr(index, "load", lambda: loads.append(True))
+    index._run()
+    assert index.use_change_stream
+    assert loads == [True]
+    assert collection.resume_after == [None, None]
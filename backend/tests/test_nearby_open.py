@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import main
+from cache import OPEN_BUCKET_MINUTES, NearbyLocationsCache
+from models import Location
+
+LATITUDE, LONGITUDE = 32.8723812680163, -117.21242234341588
+# Monday 10:07, in the 10:00-10:14 open bucket
+NOW = datetime(2024, 5, 20, 10, 7)
+OPEN_AT = 10 * 60 + 7
+
+def location(index, intervals):
+    return {"business_id": f"business-{index}", "name": f"Location {index}", "review_count": 1000 - index,
+            "location": {"type": "Point", "coordinates": [LONGITUDE, LATITUDE]}, "open_intervals": intervals}
+
+OPEN = [{"start": 0, "end": 23 * 60}]
+# Open when the bucket starts, closed from 10:05
+CLOSING = [{"start": 0, "end": 10 * 60 + 4}]
+
+class FakeCursor:
+    def __init__(self, documents, lengths):
+        self.documents = documents
+        self.lengths = lengths
+
+    def sort(self, keys):
+        return self
+
+    async def to_list(self, length):
+        self.lengths.append(length)
+        return [dict(document) for document in self.documents[:length]]
+
+class FakeLocations:
+    """Returns fixed documents in review_count order and records what it was asked for."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+        self.lengths = []
+
+    def find(self, query, projection):
+        self.queries.append(query)
+        return FakeCursor([{key: value for key, value in document.items() if projection.get(key)}
+                           for document in self.documents], self.lengths)
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+@pytest.fixture
+def locations(monkeypatch):
+    documents = [location(index, CLOSING if index % 3 == 0 else OPEN) for index in range(40)]
+    fake = FakeLocations(documents)
+    monkeypatch.setattr(main.clients, "db", type("FakeDB", (), {"locations": fake})())
+    monkeypatch.setattr(main.clients, "nearby_cache", NearbyLocationsCache(FakeRedis()))
+    monkeypatch.setattr(main, "pacific_now", lambda: NOW)
+    return fake
+
+def fetch(limit, cur_open=1):
+    items, _ = asyncio.run(main.fetch_nearby_candidates(LATITUDE, LONGITUDE, limit, 10000, ["any"], cur_open, None,
+                                                        "review_count", main.model_projection(Location)))
+    return items
+
+def test_open_page_is_trimmed_to_the_open_locations(locations):
+    items = fetch(10)
+    assert [item["business_id"] for item in items] == [f"business-{index}" for index in range(40) if index % 3][:10]
+    assert all("open_intervals" not in item for item in items)
+
+def test_open_query_covers_the_rest_of_the_bucket(locations):
+    fetch(10)
+    bucket_end = (OPEN_AT // OPEN_BUCKET_MINUTES + 1) * OPEN_BUCKET_MINUTES - 1
+    assert locations.queries[0]["open_intervals"] == {"$elemMatch": {"start": {"$lte": bucket_end}, "end": {"$gte": OPEN_AT}}}
+    assert locations.queries[0]["cur_open"] == 1
+
+def test_open_pages_are_cached_for_the_bucket(locations, monkeypatch):
+    fetch(10)
+    # Later in the same bucket the entry is reused and only rechecked against the new minute
+    monkeypatch.setattr(main, "pacific_now", lambda: NOW.replace(minute=14))
+    assert len(fetch(10)) == 10
+    assert len(locations.queries) == 1
+    # The next bucket is a new entry
+    monkeypatch.setattr(main, "pacific_now", lambda: NOW.replace(minute=15))
+    fetch(10)
+    assert len(locations.queries) == 2
+
+def test_open_fetch_asks_for_room_to_trim(locations):
+    # Half of the locations close during the bucket: the over-fetch still fills the page
+    locations.documents = [location(index, CLOSING if index % 2 else OPEN) for index in range(40)]
+    assert len(fetch(10)) == 10
+    assert locations.lengths[0] >= 2 * 10
+
+def test_without_open_filter_nothing_is_trimmed(locations):
+    items = fetch(10, cur_open=0)
+    assert len(items) == 10
+    assert [item["business_id"] for item in items] == [f"business-{index}" for index in range(10)]
+    assert "open_intervals" not in locations.queries[0]
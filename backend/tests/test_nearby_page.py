@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from cache import geohash_bounds, geohash_decode, geohash_encode, NearbyLocationsCache
+from location_queries import DISTANCE_FIELD, box_reach, great_circle_meters, nearby_page, tile_fetch_limit
+
+CENTER = (32.8723812680163, -117.21242234341588)
+
+def locations(count=2000, seed=0):
+    rng = random.Random(seed)
+    return [{"_id": index,
+             "location": {"type": "Point", "coordinates": [CENTER[1] + rng.uniform(-0.1, 0.1),
+                                                           CENTER[0] + rng.uniform(-0.1, 0.1)]},
+             "stars": rng.choice([3.0, 4.0, 5.0])}
+            for index in range(count)]
+
+LOCATIONS = locations()
+
+def distance(latitude, longitude, document):
+    document_longitude, document_latitude = document["location"]["coordinates"]
+    return great_circle_meters(latitude, longitude, document_latitude, document_longitude)
+
+def query(latitude, longitude, radius, limit, sort_by, after=None):
+    """What Mongo returns for build_nearby_query plus the page stage of ``sort_by``."""
+    documents = [document for document in LOCATIONS if distance(latitude, longitude, document) <= radius]
+    if sort_by == "distance":
+        documents = [{**document, DISTANCE_FIELD: distance(latitude, longitude, document)} for document in documents]
+        if after is not None:
+            documents = [document for document in documents
+                         if document[DISTANCE_FIELD] >= after["distance"] and document["_id"] not in after["seen"]]
+        documents.sort(key=lambda document: document[DISTANCE_FIELD])
+    else:
+        documents.sort(key=lambda document: (-document["stars"], document["_id"]))
+        if after is not None:
+            documents = [document for document in documents
+                         if (-document["stars"], document["_id"]) > (-after["key"], after["id"])]
+    return documents[:limit]
+
+def fetch_page(latitude, longitude, radius, limit, sort_by, after=None):
+    # fetch_nearby_candidates without the cache: tile first, the caller's own position when the tile cannot tell
+    page = None
+    if not (sort_by == "distance" and after is not None):
+        tile = geohash_encode(latitude, longitude, NearbyLocationsCache.tile_precision(radius))
+        tile_latitude, tile_longitude = geohash_decode(tile)
+        reach = box_reach(tile_latitude, tile_longitude, geohash_bounds(tile))
+        tile_limit = tile_fetch_limit(limit, radius, reach, sort_by)
+        candidates = query(tile_latitude, tile_longitude, radius + reach, tile_limit, sort_by, after)
+        page, state = nearby_page(candidates, latitude, longitude, radius, limit, sort_by,
+                                  len(candidates) < tile_limit, after, reach=reach, with_keys=True)
+    if page is None:
+        candidates = query(latitude, longitude, radius, limit, sort_by, after)
+        page, state = nearby_page(candidates, latitude, longitude, radius, limit, sort_by,
+                                  len(candidates) < limit, after, with_keys=True)
+    return page, state
+
+def all_pages(latitude, longitude, radius, limit, sort_by):
+    ids, after = [], None
+    for _ in range(1000):
+        page, after = fetch_page(latitude, longitude, radius, limit, sort_by, after)
+        ids += [document["_id"] for document in page]
+        if after is None:
+            return ids
+    raise AssertionError("pagination did not end")
+
+def test_box_reach_covers_the_tile():
+    tile = geohash_encode(*CENTER, 6)
+    reach = box_reach(*geohash_decode(tile), geohash_bounds(tile))
+    # A precision 6 cell is about 1.2km x 0.6km
+    assert 550 < reach < 700
+
+@pytest.mark.parametrize("radius", [300, 1000, 5000, 8000])
+@pytest.mark.parametrize("limit", [5, 20])
+@pytest.mark.parametrize("offset", [(0.0, 0.0), (0.004, -0.006), (-0.03, 0.02)])
+def test_pages_follow_the_callers_position(radius, limit, offset):
+    latitude, longitude = CENTER[0] + offset[0], CENTER[1] + offset[1]
+    for sort_by in ("stars", "distance"):
+        expected = [document["_id"] for document in query(latitude, longitude, radius, len(LOCATIONS), sort_by)]
+        first_page, _ = fetch_page(latitude, longitude, radius, limit, sort_by)
+        assert [document["_id"] for document in first_page] == expected[:limit]
+        assert all_pages(latitude, longitude, radius, limit, sort_by) == expected
+
+def test_distance_page_carries_the_callers_distance():
+    latitude, longitude = CENTER[0] + 0.004, CENTER[1] - 0.006
+    page, _ = fetch_page(latitude, longitude, 5000, 10, "distance")
+    assert [document[DISTANCE_FIELD] for document in page] == [distance(latitude, longitude, document) for document in page]
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from utils import (MINUTES_PER_DAY, MINUTES_PER_WEEK, hours_to_open_intervals, is_open_at, is_open_now,
+                   minute_of_week, open_at_query, open_during_query)
+
+MONDAY = 0
+FRIDAY = 4 * MINUTES_PER_DAY
+SUNDAY = 6 * MINUTES_PER_DAY
+
+def matches(query, intervals):
+    """Evaluate an open_at_query/open_during_query $elemMatch the way Mongo does."""
+    bounds = query["$elemMatch"]
+    return any(interval["start"] <= bounds["start"]["$lte"] and interval["end"] >= bounds["end"]["$gte"]
+               for interval in intervals)
+
+def test_minute_of_week():
+    assert minute_of_week(datetime(2024, 5, 20, 0, 0)) == 0  # Monday
+    assert minute_of_week(datetime(2024, 5, 24, 9, 30)) == FRIDAY + 9 * 60 + 30
+    assert minute_of_week(datetime(2024, 5, 26, 23, 59)) == MINUTES_PER_WEEK - 1  # Sunday
+
+def test_same_day_hours():
+    assert hours_to_open_intervals({"Monday": ["0800", "1700"]}) == [{"start": 8 * 60, "end": 17 * 60}]
+
+def test_overnight_hours_run_into_the_next_day():
+    assert hours_to_open_intervals({"Friday": ["2200", "0200"]}) == [
+        {"start": FRIDAY + 22 * 60, "end": FRIDAY + MINUTES_PER_DAY + 2 * 60}]
+
+def test_sunday_overnight_hours_wrap_to_monday():
+    intervals = hours_to_open_intervals({"Sunday": ["2200", "0200"]})
+    assert intervals == [{"start": 0, "end": 2 * 60}, {"start": SUNDAY + 22 * 60, "end": MINUTES_PER_WEEK - 1}]
+    assert is_open_at(intervals, MINUTES_PER_WEEK - 1)
+    assert is_open_at(intervals, 0)
+    assert is_open_at(intervals, 2 * 60)
+    assert not is_open_at(intervals, 2 * 60 + 1)
+
+def test_midnight_to_midnight_is_open_all_day():
+    intervals = hours_to_open_intervals({"Tuesday": ["0000", "0000"]})
+    tuesday = MINUTES_PER_DAY
+    assert intervals == [{"start": tuesday, "end": tuesday + MINUTES_PER_DAY}]
+    assert all(is_open_at(intervals, minute) for minute in range(tuesday, tuesday + MINUTES_PER_DAY))
+
+def test_sunday_midnight_to_midnight_wraps():
+    assert hours_to_open_intervals({"Sunday": ["0000", "0000"]}) == [
+        {"start": 0, "end": 0}, {"start": SUNDAY, "end": MINUTES_PER_WEEK - 1}]
+
+def test_missing_and_malformed_days_are_closed():
+    assert hours_to_open_intervals({"Monday": [], "Tuesday": ["0800"], "Wednesday": None}) == []
+    assert hours_to_open_intervals(None) == []
+
+@pytest.mark.parametrize("minute,is_open", [(8 * 60 - 1, False), (8 * 60, True), (17 * 60, True), (17 * 60 + 1, False)])
+def test_interval_ends_are_inclusive(minute, is_open):
+    intervals = hours_to_open_intervals({"Monday": ["0800", "1700"]})
+    assert is_open_at(intervals, minute) is is_open
+    assert matches(open_at_query(minute), intervals) is is_open
+
+def test_no_intervals_is_closed():
+    assert not is_open_at(None, 0)
+    assert not is_open_at([], 0)
+
+@pytest.mark.parametrize("start,end,is_open", [
+    (7 * 60, 7 * 60 + 59, False),   # closes before opening
+    (7 * 60 + 50, 8 * 60 + 4, True),  # opens during the window
+    (16 * 60 + 55, 17 * 60 + 9, True),  # closes during the window
+    (17 * 60 + 1, 17 * 60 + 14, False),
+])
+def test_open_during_matches_overlapping_intervals(start, end, is_open):
+    intervals = hours_to_open_intervals({"Monday": ["0800", "1700"]})
+    assert matches(open_during_query(start, end), intervals) is is_open
+
+def test_open_at_is_a_one_minute_window():
+    assert open_at_query(600) == open_during_query(600, 600)
+
+def test_is_open_now_falls_back_to_hours():
+    business = {"hours": {"Friday": ["2200", "0200"]}}
+    assert is_open_now(business, datetime(2024, 5, 24, 23, 0))
+    assert not is_open_now(business, datetime(2024, 5, 24, 21, 59))
+    business["open_intervals"] = hours_to_open_intervals(business["hours"])
+    assert is_open_now(business, datetime(2024, 5, 25, 1, 30))
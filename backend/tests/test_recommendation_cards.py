@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from mistral_utils import fetch_ranked_businesses
+
+# Fields the client reads from every location card
+CARD_FIELDS = {"business_id", "name", "image_url", "display_phone", "cur_open", "address", "location", "stars",
+               "review_count", "price", "phone", "hours"}
+
+LATITUDE, LONGITUDE = 32.8723812680163, -117.21242234341588
+
+def location(index, tags):
+    return {
+        "_id": index,
+        "business_id": f"business-{index}",
+        "name": f"Location {index}",
+        "image_url": f"https://example.com/{index}.jpg",
+        "phone": "+16195550100",
+        "display_phone": "(619) 555-0100",
+        "address": f"{index} Genesee Ave",
+        "location": {"type": "Point", "coordinates": [LONGITUDE + index / 1000, LATITUDE]},
+        "stars": 4,
+        "review_count": 100 * index,
+        "price": 2,
+        "cur_open": 1,
+        "summary": "A neighbourhood spot.",
+        "tags": tags,
+        "hours": {"Monday": ["0800", "1700"]},
+        "open_intervals": [{"start": 480, "end": 1020}],
+        "categories": ["Coffee & Tea"],
+    }
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents[:length] if length is not None else self.documents
+
+class FakeLocations:
+    """Runs only the $project stage of a pipeline over fixed documents."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def aggregate(self, pipeline):
+        documents = [dict(document) for document in self.documents]
+        for stage in pipeline:
+            if "$project" in stage:
+                kept = [name for name, value in stage["$project"].items() if value]
+                documents = [{name: document[name] for name in kept if name in document} for document in documents]
+        return FakeCursor(documents)
+
+class FakeSortModel:
+    async def ainvoke(self, inputs):
+        return ["L2", "L1"]
+
+def ranked_businesses(sort_by, ranker):
+    locations = FakeLocations([location(1, ["coffee"]), location(2, ["coffee", "bakeries"])])
+    return asyncio.run(fetch_ranked_businesses(LATITUDE, LONGITUDE, ["coffee"], 5000, None, sort_by, locations, [],
+                                               FakeSortModel(), ranker, ["bakeries"], "coffee and a pastry"))
+
+@pytest.mark.parametrize("sort_by,ranker", [("llmsort", "local"), ("llmsort", "llm"), ("stars", "local")])
+def test_cards_keep_client_fields(sort_by, ranker):
+    businesses = ranked_businesses(sort_by, ranker)
+    assert len(businesses) == 2
+    for business in businesses:
+        assert CARD_FIELDS <= set(business)
+        assert "_id" not in business
+
+def test_llm_ranker_cards_follow_model_order():
+    businesses = ranked_businesses("llmsort", "llm")
+    assert [business["business_id"] for business in businesses] == ["business-2", "business-1"]
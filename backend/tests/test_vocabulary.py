@@ -0,0 +1,37 @@
+import asyncio
+
+import vocabulary
+from vocabulary import aget_tag_vocabulary
+
+class FakeCollection:
+    """Counts distinct() calls; each one yields to the loop before answering."""
+    full_name = "test.vocabulary"
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.calls = 0
+
+    async def distinct(self, field):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.tags
+
+def gather_vocabularies(collection, callers):
+    async def run():
+        return await asyncio.gather(*(aget_tag_vocabulary(collection) for _ in range(callers)))
+    return asyncio.run(run())
+
+def test_concurrent_callers_reconcile_once():
+    vocabulary._vocabularies.pop(FakeCollection.full_name, None)
+    collection = FakeCollection(["coffee", "bakery"])
+    results = gather_vocabularies(collection, 20)
+    assert collection.calls == 1
+    assert all(result is results[0] for result in results)
+
+def test_stale_vocabulary_reconciles_once_more():
+    vocabulary._vocabularies.pop(FakeCollection.full_name, None)
+    collection = FakeCollection(["coffee"])
+    shared = gather_vocabularies(collection, 5)[0]
+    shared.invalidate()
+    gather_vocabularies(collection, 5)
+    assert collection.calls == 2
@@ -1,6 +1,16 @@
 from datetime import timedelta
-import uuid
+import asyncio
+import hashlib
 import json
+import logging
+import time
+import uuid
+
+import openai
+
+from vocabulary import vocabulary_registry
+
+logger = logging.getLogger(__name__)
 
 # Checks if the businesses is currently open
 def is_within_hours(now, hours):
@@ -18,29 +28,83 @@ def is_within_hours(now, hours):
 
     return open_time <= now <= close_time
 
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Minutes since Monday 00:00 in the timezone of ``now``
+def minute_of_week(now):
+    return now.weekday() * MINUTES_PER_DAY + now.hour * 60 + now.minute
+
+# Converts {"Monday": ["HHMM", "HHMM"], ...} into inclusive minute-of-week intervals.
+# Overnight hours that run past Sunday midnight are split in two.
+def hours_to_open_intervals(hours):
+    intervals = []
+    for day_index, day in enumerate(WEEKDAYS):
+        day_hours = (hours or {}).get(day)
+        if not day_hours or not isinstance(day_hours, list) or len(day_hours) != 2:
+            continue
+        open_time_str, close_time_str = day_hours
+        open_minute = int(open_time_str[:2]) * 60 + int(open_time_str[2:])
+        close_minute = int(close_time_str[:2]) * 60 + int(close_time_str[2:])
+        if close_minute <= open_minute:
+            close_minute += MINUTES_PER_DAY
+
+        start = day_index * MINUTES_PER_DAY + open_minute
+        end = day_index * MINUTES_PER_DAY + close_minute
+        if end >= MINUTES_PER_WEEK:
+            intervals.append({"start": start, "end": MINUTES_PER_WEEK - 1})
+            intervals.append({"start": 0, "end": end - MINUTES_PER_WEEK})
+        else:
+            intervals.append({"start": start, "end": end})
+    return sorted(intervals, key=lambda interval: interval["start"])
+
+# Mongo filter matching documents whose open intervals contain ``minute``
+def open_at_query(minute):
+    return open_during_query(minute, minute)
+
+# Matches documents with an open interval overlapping the minutes [start, end]
+def open_during_query(start, end):
+    return {"$elemMatch": {"start": {"$lte": end}, "end": {"$gte": start}}}
+
+def is_open_at(intervals, minute):
+    return any(interval["start"] <= minute <= interval["end"] for interval in intervals or [])
+
+# Checks open status from precomputed intervals, falling back to raw hours
+def is_open_now(business, now):
+    intervals = business.get("open_intervals")
+    if intervals is None:
+        return is_within_hours(now, (business.get("hours") or {}).get(now.strftime('%A')))
+    return is_open_at(intervals, minute_of_week(now))
+
+# Lowercased, de-duplicated category keys ("Coffee & Tea, Cafes" -> ["coffee & tea", "cafes"])
+def normalize_categories(categories):
+    if isinstance(categories, str):
+        categories = [categories]
+    keys = []
+    for category in categories or []:
+        for part in str(category).split(","):
+            key = part.strip().lower()
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
 # Generate new session id
 def generate_unique_session_id():
     return str(uuid.uuid4())
 
 # Generate new thread id
-def generate_thread_id(openai_client):
-    thread = openai_client.beta.threads.create()
+async def generate_thread_id(openai_client):
+    thread = await openai_client.beta.threads.create()
     return thread.id
 
-def open_json_file(file_path):
-    with open(file_path, 'r') as file:
-        file_content = json.load(file)
-    return file_content
-
-# Generate new assistant id
-def generate_assistant_id(openai_client):
+# Assistant definition (tools, instructions, model) used to create the assistant
+def build_assistant_spec():
     valid_limit = ["5", "10", "15"]
     valid_radius = ["500", "1600", "5000", "10000", "20000"]
     valid_cur_open = [0, 1, 1]
-    categories_file_path = "categories.json"
-    tags_file_path = "tags.json"
-    valid_categories = open_json_file(categories_file_path)
-    valid_tags = open_json_file(tags_file_path)
+    valid_categories = list(vocabulary_registry.categories_list)
+    valid_tags = list(vocabulary_registry.tags_list)
     valid_sort_by = ["review_count", "stars", "random"]
     tools = [
         {
@@ -114,18 +178,43 @@ def generate_assistant_id(openai_client):
         "Incorporate User Feedback: Actively incorporate feedback from users. Specifically, when feedback indicates a desire for better or alternative locations, always re-trigger fetch_nearby_locations_condensed with the updated criteria to refine the recommendations. Do not give the same recommendations for same places as prior messages."
         "No Duplication: Always remeber the recommendations that are given so far, and always go back to the previous conversation to make sure you do not give the same recommendations as prior unless the user wants duplication."
     )
-    assistant = openai_client.beta.assistants.create(
-        instructions=instructions,
-        name="WhatNext? Location Recommender",
-        #model="gpt-3.5-turbo-0125",
-        model="gpt-4o",
-        tools=tools,
-        temperature=1
-    )
+    return {
+        "instructions": instructions,
+        "name": "WhatNext? Location Recommender",
+        # "model": "gpt-3.5-turbo-0125",
+        "model": "gpt-4o",
+        "tools": tools,
+        "temperature": 1,
+    }
+
+# Stable fingerprint of an assistant spec; any change to tools or instructions changes it
+def assistant_spec_hash(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+# Generate new assistant id
+async def generate_assistant_id(openai_client, spec=None):
+    assistant = await openai_client.beta.assistants.create(**(spec or build_assistant_spec()))
     return assistant.id
 
+# Reuses the assistant created for the current spec, creating it only when the spec hash is new.
+# The Redis lock keeps sibling workers booting together from each creating one.
+async def provision_assistant_id(openai_client, redis_client, key_prefix="assistant:"):
+    spec = build_assistant_spec()
+    key = f"{key_prefix}{assistant_spec_hash(spec)}"
+    assistant_id = await redis_client.get(key)
+    if assistant_id:
+        return assistant_id.decode("utf-8")
+
+    async with redis_client.lock(f"{key}:lock", timeout=60, blocking_timeout=60):
+        assistant_id = await redis_client.get(key)
+        if assistant_id:
+            return assistant_id.decode("utf-8")
+        assistant_id = await generate_assistant_id(openai_client, spec)
+        await redis_client.set(key, assistant_id)
+    return assistant_id
+
 # Create sorting run
-def create_sorting_run(openai_client, thread_id, assistant_id):
+async def create_sorting_run(openai_client, thread_id, assistant_id):
     instructions = (
         "As the WhatNext? app's location sorter, review the user's most recent request, the prior conversation history, and user bio for details on user preference. "
         "Only use the user bio or preferences for sorting. "
@@ -136,7 +225,7 @@ def create_sorting_run(openai_client, thread_id, assistant_id):
         "Ensure the output adheres strictly to this structure, without any prefixes, bullet points, explanation, and additional text."
     )
     
-    run_sort = openai_client.beta.threads.runs.create(
+    run_sort = await openai_client.beta.threads.runs.create(
         thread_id=thread_id,
         assistant_id=assistant_id,
         instructions=instructions,
@@ -147,13 +236,77 @@ def create_sorting_run(openai_client, thread_id, assistant_id):
     )
     return run_sort.id
 
+class RunDeadlineExceeded(Exception):
+    pass
+
+class ClientDisconnected(Exception):
+    pass
+
+# Statuses in which a run still needs polling
+PENDING_RUN_STATUSES = ("queued", "in_progress", "cancelling")
+
+async def cancel_run(openai_client, thread_id, run_id):
+    try:
+        await openai_client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except openai.OpenAIError as e:
+        logger.warning("Could not cancel run %s: %s", run_id, e)
+
+# Polls a run with exponential backoff until it completes or needs tool outputs.
+# The run is cancelled if the deadline (time.monotonic) passes or the client goes away.
+async def wait_for_run(openai_client, thread_id, run_id, deadline, is_disconnected=None,
+                       initial_delay=0.2, max_delay=2.0, backoff=1.6):
+    delay = initial_delay
+    while True:
+        run = await openai_client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run.status not in PENDING_RUN_STATUSES:
+            return run
+
+        if is_disconnected is not None and await is_disconnected():
+            await cancel_run(openai_client, thread_id, run_id)
+            raise ClientDisconnected()
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            await cancel_run(openai_client, thread_id, run_id)
+            raise RunDeadlineExceeded()
+
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * backoff, max_delay)
+
+# Runs cancelled from a cancelled request task; references are kept until the cancel finishes
+_pending_cancels = set()
+
+# Schedules cancel_run without awaiting it, for cleanup paths that can no longer await
+def cancel_run_soon(openai_client, thread_id, run_id):
+    task = asyncio.ensure_future(cancel_run(openai_client, thread_id, run_id))
+    _pending_cancels.add(task)
+    task.add_done_callback(_pending_cancels.discard)
+
+# Iterates the events of a streamed run, raising RunDeadlineExceeded once the deadline (time.monotonic) passes
+async def iterate_run_stream(stream, deadline):
+    events = stream.__aiter__()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RunDeadlineExceeded()
+            try:
+                event = await asyncio.wait_for(events.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise RunDeadlineExceeded()
+            yield event
+    finally:
+        await stream.close()
+
 # Retrieves thread_id and assistant_id based on session_id
-def retrieve_chat_info(session_id, redis_client, openai_client, assistant_id):
-    if session_id is None or not redis_client.exists(session_id):
+async def retrieve_chat_info(session_id, redis_client, openai_client, assistant_id):
+    if session_id is None or not await redis_client.exists(session_id):
         session_id = generate_unique_session_id()
-        thread_id = generate_thread_id(openai_client)
-        redis_client.hset(session_id, mapping={"thread_id": thread_id, "assistant_id": assistant_id})
-    values = redis_client.hgetall(session_id)
+        thread_id = await generate_thread_id(openai_client)
+        await redis_client.hset(session_id, mapping={"thread_id": thread_id, "assistant_id": assistant_id})
+    values = await redis_client.hgetall(session_id)
     thread_id = values.get(b"thread_id").decode("utf-8") if values.get(b"thread_id") else None
     assistant_id = values.get(b"assistant_id").decode("utf-8") if values.get(b"assistant_id") else None
     return session_id, thread_id
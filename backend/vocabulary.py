@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from pymongo.collection import Collection
+from rapidfuzz import process, fuzz
+
+from cache import SingleFlight
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TAGS_FILE_PATH = os.path.join(BASE_DIR, "tags.json")
+CATEGORIES_FILE_PATH = os.path.join(BASE_DIR, "categories.json")
+
+def open_json_file(file_path: str):
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+class VocabularyRegistry:
+    """Valid tags and categories for the assistant tools, read once from disk.
+
+    The ordered lists feed the assistant's enums; the frozen sets are used to
+    validate tool arguments. Call reload() after editing the JSON files.
+    """
+
+    def __init__(self, tags_path: str = TAGS_FILE_PATH, categories_path: str = CATEGORIES_FILE_PATH):
+        self.tags_path = tags_path
+        self.categories_path = categories_path
+        self.version = 0
+        self.reload()
+
+    def reload(self) -> None:
+        self.tags_list: Tuple[str, ...] = tuple(open_json_file(self.tags_path))
+        self.tags: FrozenSet[str] = frozenset(self.tags_list)
+        self.categories_list: Tuple[str, ...] = tuple(open_json_file(self.categories_path))
+        self.categories: FrozenSet[str] = frozenset(self.categories_list)
+        self.version += 1
+
+vocabulary_registry = VocabularyRegistry()
+
+class TagVocabulary:
+    """Cached tag vocabulary with a batched, memoized fuzzy matcher.
+
+    The vocabulary starts from a seed list and is replaced by the database's
+    distinct values whenever it is older than ``ttl`` seconds. Every change bumps
+    ``version``, which also retires memoized resolutions made against older
+    vocabularies.
+    """
+
+    def __init__(self, seed_tags: Iterable[str], ttl: float = 600.0, memo_size: int = 2048):
+        self.ttl = ttl
+        self.memo_size = memo_size
+        self.version = 0
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._tags: Tuple[str, ...] = self._normalize(seed_tags)
+        self._reconciled_at: Optional[float] = None
+        self._memo: "OrderedDict[Tuple[int, str], Optional[str]]" = OrderedDict()
+
+    @property
+    def tags(self) -> Tuple[str, ...]:
+        return self._tags
+
+    @staticmethod
+    def _normalize(values: Iterable[str]) -> Tuple[str, ...]:
+        return tuple(sorted({value for value in values if isinstance(value, str) and value}))
+
+    def is_stale(self) -> bool:
+        return self._reconciled_at is None or time.monotonic() - self._reconciled_at > self.ttl
+
+    def invalidate(self) -> None:
+        """Force the next lookup to reconcile with the database."""
+        self._reconciled_at = None
+
+    def reconcile(self, values: Iterable[str]) -> None:
+        tags = self._normalize(values)
+        with self._lock:
+            if tags != self._tags:
+                self._tags = tags
+                self.version += 1
+                self._memo.clear()
+            self._reconciled_at = time.monotonic()
+
+    def match(self, tag_names: List[str]) -> List[str]:
+        """Resolve each requested tag to its closest vocabulary entry."""
+        with self._lock:
+            tags, version = self._tags, self.version
+            resolved: Dict[str, Optional[str]] = {}
+            for tag_name in tag_names:
+                key = (version, tag_name)
+                if key in self._memo:
+                    self._memo.move_to_end(key)
+                    resolved[tag_name] = self._memo[key]
+
+        pending = [tag_name for tag_name in dict.fromkeys(tag_names) if tag_name not in resolved]
+        if pending and tags:
+            # One vectorized pass scores every pending input against the whole vocabulary
+            scores = process.cdist(pending, tags, scorer=fuzz.ratio)
+            best = scores.argmax(axis=1)
+            with self._lock:
+                for tag_name, index in zip(pending, best):
+                    resolved[tag_name] = tags[index]
+                    if version == self.version:
+                        self._memo[(version, tag_name)] = tags[index]
+                while len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+
+        return [resolved[tag_name] for tag_name in tag_names if resolved.get(tag_name) is not None]
+
+_vocabularies: Dict[str, TagVocabulary] = {}
+_vocabularies_lock = threading.Lock()
+
+def _shared_vocabulary(collection) -> TagVocabulary:
+    with _vocabularies_lock:
+        vocabulary = _vocabularies.get(collection.full_name)
+        if vocabulary is None:
+            vocabulary = TagVocabulary(vocabulary_registry.tags_list)
+            _vocabularies[collection.full_name] = vocabulary
+    return vocabulary
+
+def get_tag_vocabulary(collection: Collection) -> TagVocabulary:
+    """Return the shared tag vocabulary for ``collection``, reconciling it if stale."""
+    vocabulary = _shared_vocabulary(collection)
+    # One thread reconciles; the others keep using the current tags meanwhile
+    if vocabulary.is_stale() and vocabulary._refresh_lock.acquire(blocking=False):
+        try:
+            if vocabulary.is_stale():
+                vocabulary.reconcile(collection.distinct("tags"))
+        finally:
+            vocabulary._refresh_lock.release()
+    return vocabulary
+
+_refreshes = SingleFlight()
+
+async def _reconcile(vocabulary: TagVocabulary, collection) -> None:
+    if vocabulary.is_stale():
+        vocabulary.reconcile(await collection.distinct("tags"))
+
+async def aget_tag_vocabulary(collection) -> TagVocabulary:
+    """Async variant of get_tag_vocabulary for Motor collections."""
+    vocabulary = _shared_vocabulary(collection)
+    # The caller that finds it stale reconciles; the others keep using the current tags meanwhile
+    if vocabulary.is_stale() and collection.full_name not in _refreshes:
+        await _refreshes.do(collection.full_name, lambda: _reconcile(vocabulary, collection))
+    return vocabulary